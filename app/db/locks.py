@@ -0,0 +1,44 @@
+# Lease locks for jobs that every worker process schedules but only one
+# should run at a time.
+# Document shape:
+# { _id: str (lock name), owner: str, expires_at: datetime }
+
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo.errors import DuplicateKeyError
+
+from app.core.config import settings
+from app.db.mongo import get_client
+
+
+def _locks() -> AsyncIOMotorCollection:
+    return get_client()[settings.MONGO_DB_NAME]["locks"]
+
+
+async def acquire_lease(name: str, ttl: timedelta) -> Optional[str]:
+    """
+    Take the named lease if it is free or its holder's lease has expired.
+    Returns an owner token for release_lease, or None if someone holds it.
+    A holder that dies without releasing blocks others for at most `ttl`.
+    """
+    now = datetime.now(timezone.utc)
+    owner = uuid.uuid4().hex
+    try:
+        # Matches only an expired lease; a live one makes the upsert try to
+        # insert a second doc with the same _id, which the server rejects.
+        await _locks().update_one(
+            {"_id": name, "expires_at": {"$lte": now}},
+            {"$set": {"owner": owner, "expires_at": now + ttl}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        return None
+    return owner
+
+
+async def release_lease(name: str, owner: str) -> None:
+    """Give the lease back early; a no-op if it has since passed to someone else."""
+    await _locks().delete_one({"_id": name, "owner": owner})
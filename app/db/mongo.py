@@ -1,12 +1,20 @@
 # MongoDB async connection using Motor driver.
 # URI is taken from the MONGO_URI environment variable.
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorCollection
+from pymongo import WriteConcern
 
 from app.core.config import settings
 
 # Module-level singleton client (created once, reused across all requests)
 _client: AsyncIOMotorClient | None = None
 
+# For high-frequency, recomputable writes (notification taps): primary ack
+# only, no journal wait. Use via collection.with_options(write_concern=...).
+FAST_WRITE_CONCERN = WriteConcern(w=1, j=False)
+
+# Collections whose indexes this process has already ensured
+_indexed: set[str] = set()
+
 
 def get_client() -> AsyncIOMotorClient:
     global _client
@@ -23,8 +31,10 @@ async def get_users_collection() -> AsyncIOMotorCollection:
     client = get_client()
     db = client[settings.MONGO_DB_NAME]
     collection = db["users"]
-    # Idempotent: only creates the index if it doesn't exist
-    await collection.create_index("firebase_uid", unique=True)
+    # Idempotent, but still a round trip — only issue it once per process
+    if "users" not in _indexed:
+        await collection.create_index("firebase_uid", unique=True)
+        _indexed.add("users")
     return collection
 
 
@@ -37,9 +47,11 @@ async def get_daily_logs_collection() -> AsyncIOMotorCollection:
     db = client[settings.MONGO_DB_NAME]
     collection = db["daily_logs"]
     # Compound unique index: one document per user per day
-    await collection.create_index(
-        [("firebase_uid", 1), ("date", 1)], unique=True
-    )
+    if "daily_logs" not in _indexed:
+        await collection.create_index(
+            [("firebase_uid", 1), ("date", 1)], unique=True
+        )
+        _indexed.add("daily_logs")
     return collection
 
 
@@ -52,7 +64,16 @@ async def get_meal_plans_collection() -> AsyncIOMotorCollection:
     db = client[settings.MONGO_DB_NAME]
     collection = db["meal_plans"]
     # Compound unique index: one saved plan per user per day
-    await collection.create_index(
-        [("firebase_uid", 1), ("date", 1)], unique=True
-    )
+    if "meal_plans" not in _indexed:
+        await collection.create_index(
+            [("firebase_uid", 1), ("date", 1)], unique=True
+        )
+        _indexed.add("meal_plans")
     return collection
+
+
+async def ensure_indexes() -> None:
+    """Create the users / daily_logs / meal_plans indexes up front (startup)."""
+    await get_users_collection()
+    await get_daily_logs_collection()
+    await get_meal_plans_collection()
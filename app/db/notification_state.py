@@ -2,35 +2,72 @@
 # Document shape:
 # {
 #     firebase_uid: str, date: str, notification_type: str, slot_label: str,
-#     scheduled_utc: datetime, status: str, action_taken: str | None, etc.
+#     scheduled_utc: datetime, status: str, action_taken: str | None,
+#     timezone: str (user's IANA zone at seed time), etc.
 # }
 
-from datetime import datetime, timezone
+import logging
+from datetime import datetime, timedelta, timezone
 from typing import Optional
 
+from bson.codec_options import CodecOptions
 from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 
-from app.db.mongo import get_client
+from app.db.mongo import FAST_WRITE_CONCERN, get_client
 import os
 
 DB_NAME: str = os.getenv("MONGO_DB_NAME", "health_ai")
 
+logger = logging.getLogger(__name__)
+
+# MongoDB duplicate-key error code
+_DUPLICATE_KEY = 11000
+
+# Set once the slot indexes have been ensured in this process
+_indexed = False
+
+# Every datetime on a state doc is stored as UTC; decode them as aware
+# UTC so readers can compare against datetime.now(timezone.utc) directly.
+_CODEC_OPTIONS = CodecOptions(tz_aware=True, tzinfo=timezone.utc)
+
+# Fields the scheduler cycle reads from each open state
+_CYCLE_PROJECTION = {
+    "_id": 0,
+    "firebase_uid": 1,
+    "status": 1,
+    "slot_label": 1,
+    "notification_type": 1,
+    "scheduled_utc": 1,
+    "sent_at": 1,
+    "reminded_15_at": 1,
+    "reminded_30_at": 1,
+}
+
 # Collection accessor
 
 async def get_notification_states_collection() -> AsyncIOMotorCollection:
+    global _indexed
     client = get_client()
     db = client[DB_NAME]
-    collection = db["notification_states"]
-    await collection.create_index(
-        [("firebase_uid", 1), ("date", 1), ("slot_label", 1)],
-        unique=True,
-    )
+    collection = db.get_collection("notification_states", codec_options=_CODEC_OPTIONS)
+    if not _indexed:
+        await collection.create_index(
+            [("firebase_uid", 1), ("date", 1), ("slot_label", 1)],
+            unique=True,
+        )
+        # Scheduler cycle: open slots for a date, equality then $in bounds
+        await collection.create_index(
+            [("date", 1), ("status", 1), ("scheduled_utc", 1)]
+        )
+        _indexed = True
     return collection
 
 
 # CRUD helpers
 
-async def upsert_state(
+def _upsert_spec(
     firebase_uid: str,
     date: str,
     slot_label: str,
@@ -38,19 +75,15 @@ async def upsert_state(
     scheduled_utc: datetime,
     status: str = "pending",
     **kwargs,
-) -> None:
-    """
-    Insert a notification state document, or update status/timestamps
-    if it already exists.  `kwargs` can pass sent_at, reminded_15_at, etc.
-    """
-    col = await get_notification_states_collection()
+) -> tuple[dict, dict]:
+    """Filter + update document shared by upsert_state and build_upsert_op."""
     update_fields = {
         "notification_type": notification_type,
         "scheduled_utc": scheduled_utc,
         "status": status,
         **kwargs,
     }
-    await col.update_one(
+    return (
         {"firebase_uid": firebase_uid, "date": date, "slot_label": slot_label},
         {
             "$set": update_fields,
@@ -65,17 +98,103 @@ async def upsert_state(
                 "action_taken": None,
             },
         },
-        upsert=True,
     )
 
 
+def build_upsert_op(**state) -> UpdateOne:
+    """
+    Build a pymongo UpdateOne for bulk_write.
+    Takes the same keyword arguments as upsert_state.
+    """
+    filter_, update = _upsert_spec(**state)
+    return UpdateOne(filter_, update, upsert=True)
+
+
+async def upsert_state(
+    firebase_uid: str,
+    date: str,
+    slot_label: str,
+    notification_type: str,
+    scheduled_utc: datetime,
+    status: str = "pending",
+    **kwargs,
+) -> None:
+    """
+    Insert a notification state document, or update status/timestamps
+    if it already exists.  `kwargs` can pass sent_at, reminded_15_at, etc.
+    """
+    col = await get_notification_states_collection()
+    filter_, update = _upsert_spec(
+        firebase_uid, date, slot_label, notification_type,
+        scheduled_utc, status, **kwargs,
+    )
+    await col.update_one(filter_, update, upsert=True)
+
+
+async def bulk_upsert_states(states: list[dict]) -> int:
+    """
+    Upsert many state documents in a single bulk_write round-trip.
+    Each item takes the same keyword arguments as upsert_state.
+    Returns the number of operations submitted.
+    """
+    if not states:
+        return 0
+    col = await get_notification_states_collection()
+    ops = [build_upsert_op(**s) for s in states]
+    try:
+        await col.bulk_write(ops, ordered=False)
+    except BulkWriteError as exc:
+        # Two concurrent upserts of the same slot can race on the unique
+        # index; the loser's document already exists, so that is harmless.
+        # ordered=False means every other op was still applied.
+        errors = exc.details.get("writeErrors", [])
+        if exc.details.get("writeConcernErrors") or any(
+            e.get("code") != _DUPLICATE_KEY for e in errors
+        ):
+            raise
+        logger.info("bulk_upsert_states: %d duplicate-key races ignored", len(errors))
+    return len(ops)
+
+
+async def bulk_transition_states(transitions: list[dict]) -> int:
+    """
+    Apply many scheduler status transitions in one unordered bulk_write.
+    Each item has firebase_uid, date, slot_label, from_status and
+    from_scheduled_utc (what the scheduler read) and the fields to $set
+    (status, sent_at, ...).
+    A slot resolved or snoozed by the user mid-cycle is left alone. A snooze
+    can reset the status to the same "pending" the scheduler read, so
+    scheduled_utc, which every snooze moves, is matched as well.
+    Returns the number of states modified.
+    """
+    if not transitions:
+        return 0
+    col = await get_notification_states_collection()
+    ops = []
+    for t in transitions:
+        fields = dict(t)
+        filter_ = {
+            "firebase_uid": fields.pop("firebase_uid"),
+            "date": fields.pop("date"),
+            "slot_label": fields.pop("slot_label"),
+            "status": fields.pop("from_status"),
+            "scheduled_utc": fields.pop("from_scheduled_utc"),
+        }
+        ops.append(UpdateOne(filter_, {"$set": fields}))
+    result = await col.bulk_write(ops, ordered=False)
+    return result.modified_count
+
+
 async def get_state(
-    firebase_uid: str, date: str, slot_label: str
+    firebase_uid: str,
+    date: str,
+    slot_label: str,
+    projection: Optional[dict] = None,
 ) -> Optional[dict]:
     col = await get_notification_states_collection()
     return await col.find_one(
         {"firebase_uid": firebase_uid, "date": date, "slot_label": slot_label},
-        {"_id": 0},
+        projection or {"_id": 0},
     )
 
 
@@ -85,7 +204,9 @@ async def mark_resolved(
     slot_label: str,
     action_taken: str,
 ) -> None:
-    col = await get_notification_states_collection()
+    col = (await get_notification_states_collection()).with_options(
+        write_concern=FAST_WRITE_CONCERN
+    )
     await col.update_one(
         {"firebase_uid": firebase_uid, "date": date, "slot_label": slot_label},
         {
@@ -106,7 +227,9 @@ async def update_scheduled_utc(
     new_status: str = "pending",
 ) -> None:
     """Push scheduled_utc forward (snooze) and reset status to pending."""
-    col = await get_notification_states_collection()
+    col = (await get_notification_states_collection()).with_options(
+        write_concern=FAST_WRITE_CONCERN
+    )
     await col.update_one(
         {"firebase_uid": firebase_uid, "date": date, "slot_label": slot_label},
         {
@@ -121,27 +244,58 @@ async def update_scheduled_utc(
     )
 
 
-async def get_all_pending_states(date: str) -> list[dict]:
+async def get_due_states_with_tokens(
+    date: str,
+    now: datetime,
+    reminder_gap: timedelta,
+) -> list[dict]:
     """
-    Return all non-resolved, non-expired state docs for a given date.
-    Used by the scheduler bulk cycle.
+    Return the state docs for a given date that the scheduler must act on
+    at `now`: pending slots past scheduled_utc, and sent / reminded slots
+    whose last push is at least `reminder_gap` old. Docs are trimmed to the
+    fields the cycle reads, each with the owner's `fcm_token` joined in
+    (absent if the user has none).
     """
+    cutoff = now - reminder_gap
+    # date sits in every branch so each clause is index-bounded
+    due = [
+        {"date": date, "status": "pending",     "scheduled_utc":  {"$lte": now}},
+        {"date": date, "status": "sent",        "sent_at":        {"$lte": cutoff}},
+        {"date": date, "status": "reminded_15", "reminded_15_at": {"$lte": cutoff}},
+        {"date": date, "status": "reminded_30", "reminded_30_at": {"$lte": cutoff}},
+    ]
     col = await get_notification_states_collection()
-    cursor = col.find(
-        {
-            "date": date,
-            "status": {"$nin": ["resolved", "expired"]},
-        },
-        {"_id": 0},
+    cursor = col.aggregate(
+        [
+            {"$match": {"$or": due}},
+            {"$project": _CYCLE_PROJECTION},
+            {"$lookup": {
+                "from": "users",
+                "localField": "firebase_uid",
+                "foreignField": "firebase_uid",
+                "pipeline": [{"$project": {"_id": 0, "fcm_token": 1}}],
+                "as": "_user",
+            }},
+            {"$set": {"fcm_token": {"$arrayElemAt": ["$_user.fcm_token", 0]}}},
+            {"$unset": "_user"},
+        ],
+        batchSize=1000,
     )
     return await cursor.to_list(length=5000)
 
 
-async def get_user_states_for_date(firebase_uid: str, date: str) -> list[dict]:
-    """All states for a specific user on a specific date."""
+async def get_user_states_for_date(
+    firebase_uid: str,
+    date: str,
+    projection: Optional[dict] = None,
+) -> list[dict]:
+    """
+    All states for a specific user on a specific date.
+    Served by the (firebase_uid, date, slot_label) index prefix.
+    """
     col = await get_notification_states_collection()
     cursor = col.find(
         {"firebase_uid": firebase_uid, "date": date},
-        {"_id": 0},
+        projection or {"_id": 0},
     ).sort("scheduled_utc", 1)
     return await cursor.to_list(length=100)
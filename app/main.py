@@ -3,7 +3,10 @@ from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 
+from app.db.mongo import ensure_indexes
+from app.db.notification_state import get_notification_states_collection
 from app.graph.health_graph import build_graph
 from app.routes.profile import router as profile_router
 from app.routes.daily_logs import router as daily_logs_router
@@ -15,6 +18,7 @@ from app.routes.hydration_insights import router as hydration_insights_router
 from app.routes.predictive import router as predictive_router
 from app.routes.notifications import router as notifications_router
 from app.scheduler import create_scheduler, seed_daily_states
+from app.services.fcm_service import startup_fcm
 
 logger = logging.getLogger(__name__)
 
@@ -22,10 +26,23 @@ logger = logging.getLogger(__name__)
 # Startup and shutdown logic
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # Before the scheduler starts, so its first cycle sends on a warm client
+    try:
+        await startup_fcm()
+    except Exception as exc:
+        logger.warning("Firebase startup init failed: %s", exc)
+
     logger.info("Starting notification scheduler...")
     _scheduler = create_scheduler()
     _scheduler.start()
 
+    # Build indexes before traffic so no request pays for create_index
+    try:
+        await ensure_indexes()
+        await get_notification_states_collection()
+    except Exception as exc:
+        logger.warning("Startup index creation failed: %s", exc)
+
     # Seed notification states for today
     try:
         seeded = await seed_daily_states()
@@ -43,6 +60,7 @@ app = FastAPI(
     description="Backend for TriVita Health App",
     version="2.0.0",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 # CORS configuration
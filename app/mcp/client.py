@@ -96,7 +96,8 @@ class MCPHealthClient:
         try:
             today = datetime.now().strftime("%Y-%m-%d")
             log = await self._db["daily_logs"].find_one(
-                {"firebase_uid": firebase_uid, "date": today}, {"_id": 0}
+                {"firebase_uid": firebase_uid, "date": today},
+                {"sleep": 1, "hydration": 1, "nutrition": 1, "_id": 0},
             )
             if not log:
                 return {}
@@ -109,6 +110,7 @@ class MCPHealthClient:
                 "sleep_bed_time":  sleep.get("bed_time"),
                 "sleep_wake_time": sleep.get("wake_time"),
                 "hydration_ml":    hydration.get("total_ml"),
+                "hydration_entries": hydration.get("entries") or [],
                 "calories":        totals.get("calories"),
                 "protein_g":       totals.get("protein"),
                 "carbs_g":         totals.get("carbs"),
@@ -122,15 +124,20 @@ class MCPHealthClient:
     # 7-day health trends
 
     async def get_health_trends(
-        self, firebase_uid: str, days: int = 7
+        self, firebase_uid: str, days: int = 7, include_sleep_records: bool = False
     ) -> Dict[str, Any]:
-        """MCP Tool: get-health-trends"""
+        """
+        MCP Tool: get-health-trends
+
+        With include_sleep_records, also returns the per-day sleep rows
+        (date, hours, bed_time, wake_time) from the same query.
+        """
         await self.ensure_connected()
         try:
             start_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
             cursor = self._db["daily_logs"].find(
                 {"firebase_uid": firebase_uid, "date": {"$gte": start_date}},
-                {"sleep": 1, "hydration": 1, "nutrition": 1, "_id": 0},
+                {"sleep": 1, "hydration": 1, "nutrition": 1, "date": 1, "_id": 0},
             ).sort("date", 1)
             recent_logs = await cursor.to_list(length=days)
 
@@ -148,13 +155,26 @@ class MCPHealthClient:
             def _avg(lst):
                 return round(sum(lst) / len(lst), 1) if lst else None
 
-            return {
+            trends = {
                 "avg_sleep_7days":     _avg(_vals(["sleep", "hours"])),
                 "avg_hydration_7days": _avg(_vals(["hydration", "total_ml"])),
                 "avg_calories_7days":  _avg(_vals(["nutrition", "totals", "calories"])),
                 "avg_protein_7days":   _avg(_vals(["nutrition", "totals", "protein"])),
                 "days_logged":         len(recent_logs),
             }
+            if include_sleep_records:
+                records = []
+                for log in recent_logs:
+                    sleep = log.get("sleep") or {}
+                    if sleep.get("hours") is not None:
+                        records.append({
+                            "date":      log.get("date", "?"),
+                            "hours":     sleep.get("hours"),
+                            "bed_time":  sleep.get("bed_time", "?"),
+                            "wake_time": sleep.get("wake_time", "?"),
+                        })
+                trends["sleep_records"] = records
+            return trends
         except Exception as e:
             print(f"[MCP] get_health_trends error: {e}")
             return {}
@@ -5,9 +5,11 @@ import math
 import re
 from datetime import datetime, date as dt_date, timezone, timedelta
 from typing import Optional
+from zoneinfo import ZoneInfo
 
 from fastapi import APIRouter, Depends, HTTPException, Query, status
 from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import ReturnDocument
 
 from app.db.mongo import get_daily_logs_collection, get_users_collection
 from app.models.daily_log import (
@@ -17,10 +19,13 @@ from app.models.daily_log import (
     SleepEntryMode,
     SleepLogRequest,
 )
-from app.services.scoring import recompute_scores
+from app.services.predictive_cache import invalidate_predictive_cache
+from app.services.scoring import SCORE_INPUT_PROJECTION, recompute_scores
 
 router = APIRouter(tags=["Daily Logs"])
 
+_IST = ZoneInfo("Asia/Kolkata")
+
 
 # Helpers
 
@@ -30,8 +35,7 @@ def _today() -> str:
 
 def _now_hhmm() -> str:
     """Return current time as HH:MM in IST (Asia/Kolkata)."""
-    import pytz
-    return datetime.now(pytz.timezone("Asia/Kolkata")).strftime("%H:%M")
+    return datetime.now(_IST).strftime("%H:%M")
 
 
 def _parse_to_minutes(t: str) -> int:
@@ -158,19 +162,24 @@ async def log_sleep(
     if not sleep_doc.get("bed_time") and existing_sleep.get("bed_time"):
         sleep_doc["bed_time"] = existing_sleep["bed_time"]
 
-    # Upsert: create day doc if it doesn't exist, then set sleep section
-    await logs_col.update_one(
+    # Upsert: create day doc if it doesn't exist, then set sleep section;
+    # the post-update doc comes back so scoring needs no second read
+    log_doc = await logs_col.find_one_and_update(
         {"firebase_uid": firebase_uid, "date": today},
         {
             "$set":         {"sleep": sleep_doc, "updated_at": datetime.now(timezone.utc)},
             "$setOnInsert": {"firebase_uid": firebase_uid, "date": today},
         },
+        projection=SCORE_INPUT_PROJECTION,
         upsert=True,
+        return_document=ReturnDocument.AFTER,
     )
+    invalidate_predictive_cache(firebase_uid)
 
     sleep_hrs, water_ml, cal = await _get_user_targets(firebase_uid, users_col)
     scores = await recompute_scores(
         logs_col, firebase_uid, today,
+        doc=log_doc,
         sleep_target_hours=sleep_hrs,
         water_target_ml=water_ml,
         calorie_target=cal,
@@ -193,7 +202,8 @@ async def log_hydration(
 
     entry = {"amount_ml": body.amount_ml, "estimated_time": estimated_time, "logged_time": logged_time}
 
-    await logs_col.update_one(
+    # Get the post-update doc back so scoring needs no second read
+    log_doc = await logs_col.find_one_and_update(
         {"firebase_uid": firebase_uid, "date": today},
         {
             "$inc":         {"hydration.total_ml": body.amount_ml},
@@ -201,12 +211,16 @@ async def log_hydration(
             "$set":         {"updated_at": datetime.now(timezone.utc)},
             "$setOnInsert": {"firebase_uid": firebase_uid, "date": today},
         },
+        projection=SCORE_INPUT_PROJECTION,
         upsert=True,
+        return_document=ReturnDocument.AFTER,
     )
+    invalidate_predictive_cache(firebase_uid)
 
     sleep_hrs, water_ml, cal = await _get_user_targets(firebase_uid, users_col)
     scores = await recompute_scores(
         logs_col, firebase_uid, today,
+        doc=log_doc,
         sleep_target_hours=sleep_hrs,
         water_target_ml=water_ml,
         calorie_target=cal,
@@ -242,7 +256,8 @@ async def log_nutrition(
         "meal_calories":  meal_calories,
     }
 
-    await logs_col.update_one(
+    # Get the post-update doc back so scoring needs no second read
+    log_doc = await logs_col.find_one_and_update(
         {"firebase_uid": firebase_uid, "date": today},
         {
             "$push": {"nutrition.entries": entry},
@@ -255,12 +270,16 @@ async def log_nutrition(
             "$set":         {"updated_at": datetime.now(timezone.utc)},
             "$setOnInsert": {"firebase_uid": firebase_uid, "date": today},
         },
+        projection=SCORE_INPUT_PROJECTION,
         upsert=True,
+        return_document=ReturnDocument.AFTER,
     )
+    invalidate_predictive_cache(firebase_uid)
 
     sleep_hrs, water_ml, cal = await _get_user_targets(firebase_uid, users_col)
     scores = await recompute_scores(
         logs_col, firebase_uid, today,
+        doc=log_doc,
         sleep_target_hours=sleep_hrs,
         water_target_ml=water_ml,
         calorie_target=cal,
@@ -288,6 +307,7 @@ async def get_today_log(
     sleep_hrs, water_ml, cal = await _get_user_targets(firebase_uid, users_col)
     scores = await recompute_scores(
         logs_col, firebase_uid, today,
+        doc=doc,
         sleep_target_hours=sleep_hrs,
         water_target_ml=water_ml,
         calorie_target=cal,
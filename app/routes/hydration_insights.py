@@ -1,17 +1,88 @@
 # Hydration AI Insights route: Patterns and advice for water intake.
 from __future__ import annotations
 
+import asyncio
 import json
 import os
-from datetime import datetime
+from typing import AsyncIterator
 
+import orjson
 from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from groq import AsyncGroq
 
 from app.mcp import get_mcp_client
 
 router = APIRouter(prefix="/hydration", tags=["Hydration AI Insights"])
 
+# Shared across requests so the HTTP connection pool (and TLS) is reused
+_groq_client = AsyncGroq(api_key=os.getenv("GROQ_API_KEY"))
+
+SYSTEM_PROMPT = (
+    "You are a personal health AI specialising in hydration science. "
+    "Be empathetic, specific, and actionable. "
+    "Return ONLY a valid JSON object with exactly these three keys:\n"
+    "  \"ai_advice\"       : 2–3 sentence personalised hydration advice "
+    "for the rest of the day or tomorrow.\n"
+    "  \"timing_analysis\" : 2 sentence analysis of WHEN the user drinks "
+    "water — flag risks like all-at-once intake, long gaps, "
+    "or morning dehydration. If no entries, give general timing advice.\n"
+    "  \"peak_time\"       : A short string (e.g. 'afternoon', '2:30 PM', "
+    "'evening') describing when most water was consumed, "
+    "or 'none yet' if no entries.\n"
+    "Do NOT wrap in markdown code blocks."
+)
+
+
+async def _build_user_prompt(uid: str) -> str:
+    """Fetch today's hydration context and render the LLM user prompt."""
+    mcp = await get_mcp_client()
+
+    # Profile + today log in parallel; the log already carries the
+    # timestamped hydration entries, so no second daily_logs read.
+    profile, today_log = await asyncio.gather(
+        mcp.get_user_profile(uid),
+        mcp.get_today_health_log(uid),
+    )
+    entries: list = today_log.get("hydration_entries") or []
+
+    # Context variables
+    name         = profile.get("name") or "User"
+    water_target = profile.get("hydration_target") or 2500
+    total_ml     = today_log.get("hydration_ml") or 0
+    remaining    = max(0, water_target - total_ml)
+
+    # Build readable entries string (list comp lets str.join pre-size)
+    entries_str = (
+        "\n".join([
+            f"  • {e.get('logged_time', '?')} — {e.get('amount_ml', '?')} ml"
+            for e in entries
+        ])
+        if entries
+        else "  No entries logged yet today."
+    )
+
+    entry_count  = len(entries)
+    pct_complete = round(total_ml / water_target * 100) if water_target else 0
+
+    return (
+        f"Name: {name}\n"
+        f"Daily water target: {water_target} ml\n"
+        f"Total consumed today: {total_ml} ml  ({pct_complete}% of goal)\n"
+        f"Remaining: {remaining} ml\n"
+        f"Number of logged entries: {entry_count}\n"
+        f"Water intake log (time – amount):\n{entries_str}\n\n"
+        "Generate personalised hydration insights."
+    )
+
+
+def _shape_result(result: dict) -> dict:
+    return {
+        "ai_advice":       result.get("ai_advice", ""),
+        "timing_analysis": result.get("timing_analysis", ""),
+        "peak_time":       result.get("peak_time", ""),
+    }
+
 
 @router.get("/ai-insights")
 async def get_hydration_ai_insights(uid: str = Query(..., description="Firebase UID")):
@@ -20,76 +91,12 @@ async def get_hydration_ai_insights(uid: str = Query(..., description="Firebase
     logged water intake entries.
     """
     try:
-        mcp = await get_mcp_client()
-
-        # Profile + today log in parallel
-        import asyncio
-        profile, today_log = await asyncio.gather(
-            mcp.get_user_profile(uid),
-            mcp.get_today_health_log(uid),
-        )
-
-        # Fetch today's hydration entries (with timestamps) directly from MongoDB
-        await mcp.ensure_connected()
-        today = datetime.now().strftime("%Y-%m-%d")
-        log_doc = await mcp._db["daily_logs"].find_one(
-            {"firebase_uid": uid, "date": today},
-            {"hydration": 1, "_id": 0},
-        )
-
-        entries: list = []
-        if log_doc:
-            hydration = log_doc.get("hydration") or {}
-            entries = hydration.get("entries") or []
-
-        # Context variables
-        name         = profile.get("name") or "User"
-        water_target = profile.get("hydration_target") or 2500
-        total_ml     = today_log.get("hydration_ml") or 0
-        remaining    = max(0, water_target - total_ml)
-
-        # Build readable entries string
-        if entries:
-            entries_str = "\n".join(
-                f"  • {e.get('logged_time', '?')} — {e.get('amount_ml', '?')} ml"
-                for e in entries
-            )
-        else:
-            entries_str = "  No entries logged yet today."
-
-        entry_count  = len(entries)
-        pct_complete = round(total_ml / water_target * 100) if water_target else 0
-
-        user_prompt = (
-            f"Name: {name}\n"
-            f"Daily water target: {water_target} ml\n"
-            f"Total consumed today: {total_ml} ml  ({pct_complete}% of goal)\n"
-            f"Remaining: {remaining} ml\n"
-            f"Number of logged entries: {entry_count}\n"
-            f"Water intake log (time – amount):\n{entries_str}\n\n"
-            "Generate personalised hydration insights."
-        )
+        user_prompt = await _build_user_prompt(uid)
 
-        system_prompt = (
-            "You are a personal health AI specialising in hydration science. "
-            "Be empathetic, specific, and actionable. "
-            "Return ONLY a valid JSON object with exactly these three keys:\n"
-            "  \"ai_advice\"       : 2–3 sentence personalised hydration advice "
-            "for the rest of the day or tomorrow.\n"
-            "  \"timing_analysis\" : 2 sentence analysis of WHEN the user drinks "
-            "water — flag risks like all-at-once intake, long gaps, "
-            "or morning dehydration. If no entries, give general timing advice.\n"
-            "  \"peak_time\"       : A short string (e.g. 'afternoon', '2:30 PM', "
-            "'evening') describing when most water was consumed, "
-            "or 'none yet' if no entries.\n"
-            "Do NOT wrap in markdown code blocks."
-        )
-
-        groq_client = AsyncGroq(api_key=os.getenv("GROQ_API_KEY"))
-        response = await groq_client.chat.completions.create(
+        response = await _groq_client.chat.completions.create(
             model="llama-3.3-70b-versatile",
             messages=[
-                {"role": "system", "content": system_prompt},
+                {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user",   "content": user_prompt},
             ],
             temperature=0.72,
@@ -98,13 +105,9 @@ async def get_hydration_ai_insights(uid: str = Query(..., description="Firebase
         )
 
         raw    = response.choices[0].message.content
-        result = json.loads(raw)
+        result = orjson.loads(raw)
 
-        return {
-            "ai_advice":       result.get("ai_advice", ""),
-            "timing_analysis": result.get("timing_analysis", ""),
-            "peak_time":       result.get("peak_time", ""),
-        }
+        return _shape_result(result)
 
     except json.JSONDecodeError as e:
         raise HTTPException(
@@ -113,3 +116,49 @@ async def get_hydration_ai_insights(uid: str = Query(..., description="Firebase
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/ai-insights/stream")
+async def stream_hydration_ai_insights(uid: str = Query(..., description="Firebase UID")):
+    """
+    Server-Sent Events variant of /ai-insights for clients that render
+    tokens as they arrive.
+
+    Emits one `data:` event per JSON-encoded token delta, then a final
+    `event: done` carrying the same object /ai-insights returns
+    (or `event: error` if the accumulated output is not valid JSON).
+    """
+    try:
+        user_prompt = await _build_user_prompt(uid)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def _events() -> AsyncIterator[str]:
+        # JSON mode is not available with streaming; the system prompt
+        # already pins the output to a bare JSON object.
+        stream = await _groq_client.chat.completions.create(
+            model="llama-3.3-70b-versatile",
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user",   "content": user_prompt},
+            ],
+            temperature=0.72,
+            max_tokens=350,
+            stream=True,
+        )
+
+        parts: list[str] = []
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                parts.append(delta)
+                yield f"data: {json.dumps(delta)}\n\n"
+
+        try:
+            result = _shape_result(orjson.loads("".join(parts)))
+        except json.JSONDecodeError as e:
+            yield f"event: error\ndata: {json.dumps(f'AI response parse error: {e}')}\n\n"
+            return
+        yield f"event: done\ndata: {json.dumps(result)}\n\n"
+
+    return StreamingResponse(_events(), media_type="text/event-stream")
@@ -42,6 +42,23 @@ def _build_profile_state(profile: dict, log: dict) -> dict:
     }
 
 
+def _supplied_targets(snapshot) -> dict | None:
+    """
+    Validate a client-supplied targets_snapshot (as returned by
+    /meal-plan/generate).  Returns None unless both targets are sane numbers.
+    """
+    if not isinstance(snapshot, dict):
+        return None
+    cal  = snapshot.get("calorie_target")
+    prot = snapshot.get("protein_target")
+    for v in (cal, prot):
+        if isinstance(v, bool) or not isinstance(v, (int, float)):
+            return None
+    if not (800 <= cal <= 10000 and 0 <= prot <= 500):
+        return None
+    return {"calorie_target": cal, "protein_target": prot}
+
+
 # Endpoints
 
 @router.get("/meal-plan/saved", summary="Get saved meal plan for a date")
@@ -105,7 +122,6 @@ async def generate_meal_plan(
 async def save_meal_plan(
     body: dict = Body(...),
     meal_plans_col: AsyncIOMotorCollection = Depends(get_meal_plans_collection),
-    users_col: AsyncIOMotorCollection = Depends(get_users_collection),
 ):
     uid           = body.get("uid")
     date          = body.get("date", _today())
@@ -118,12 +134,19 @@ async def save_meal_plan(
     if not meals:
         raise HTTPException(status_code=400, detail="meals list is required")
 
-    profile = await users_col.find_one({"firebase_uid": uid}, {"_id": 0})
-    targets = (profile or {}).get("targets", {})
-    targets_snapshot = {
-        "calorie_target": targets.get("calorie_target", 2000),
-        "protein_target": targets.get("protein_target", 150),
-    }
+    # The client usually saves exactly what /meal-plan/generate returned,
+    # so trust its snapshot and only hit the users collection as a fallback.
+    targets_snapshot = _supplied_targets(body.get("targets_snapshot"))
+    if targets_snapshot is None:
+        users_col = await get_users_collection()
+        profile = await users_col.find_one(
+            {"firebase_uid": uid}, {"targets": 1, "_id": 0}
+        )
+        targets = (profile or {}).get("targets", {})
+        targets_snapshot = {
+            "calorie_target": targets.get("calorie_target", 2000),
+            "protein_target": targets.get("protein_target", 150),
+        }
 
     now_iso = datetime.now(timezone.utc).isoformat()
     doc = {
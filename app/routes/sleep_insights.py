@@ -8,11 +8,12 @@ Generates personalised, LLM-powered sleep insights for the user:
 """
 from __future__ import annotations
 
+import hashlib
 import json
 import os
 import asyncio
-from datetime import datetime, timedelta
 
+from cachetools import TTLCache
 from fastapi import APIRouter, HTTPException, Query
 from groq import AsyncGroq
 
@@ -20,9 +21,20 @@ from app.mcp import get_mcp_client
 
 router = APIRouter(prefix="/sleep", tags=["Sleep AI Insights"])
 
+# Shared across requests so the HTTP connection pool (and TLS) is reused
+_groq_client = AsyncGroq(api_key=os.getenv("GROQ_API_KEY"))
+
+# Shaped insights keyed by a hash of the user prompt (the system prompt is
+# constant). The prompt embeds today's log and the 7-day history, so new
+# sleep data produces a new key; ?refresh=true bypasses the cache.
+_llm_cache: TTLCache = TTLCache(maxsize=2048, ttl=3600)
+
 
 @router.get("/ai-insights")
-async def get_sleep_ai_insights(uid: str = Query(..., description="Firebase UID")):
+async def get_sleep_ai_insights(
+    uid: str = Query(..., description="Firebase UID"),
+    refresh: bool = Query(False, description="Skip the cache and ask for fresh tips"),
+):
     """
     Return AI-generated sleep insights for a user based on today's log
     and 7-day history.
@@ -34,30 +46,11 @@ async def get_sleep_ai_insights(uid: str = Query(..., description="Firebase UID"
         profile, today_log, trends = await asyncio.gather(
             mcp.get_user_profile(uid),
             mcp.get_today_health_log(uid),
-            mcp.get_health_trends(uid, days=7),
+            mcp.get_health_trends(uid, days=7, include_sleep_records=True),
         )
 
-        # Also pull the last 7 individual sleep records for detailed trend analysis
-        await mcp.ensure_connected()
-        start_date = (datetime.now() - timedelta(days=7)).strftime("%Y-%m-%d")
-        cursor = mcp._db["daily_logs"].find(
-            {"firebase_uid": uid, "date": {"$gte": start_date}},
-            {"sleep": 1, "date": 1, "_id": 0},
-        ).sort("date", 1)
-        last_7_days = await cursor.to_list(length=7)
-
-        # Build a readable sleep history string
-        sleep_records = []
-        for log in last_7_days:
-            s = log.get("sleep") or {}
-            if s.get("hours") is not None:
-                sleep_records.append({
-                    "date":      log.get("date", "?"),
-                    "hours":     s.get("hours"),
-                    "bed_time":  s.get("bed_time", "?"),
-                    "wake_time": s.get("wake_time", "?"),
-                })
-
+        # Build a readable sleep history string from the same 7-day read
+        sleep_records = trends.get("sleep_records") or []
         history_str = (
             "\n".join(
                 f"  • {r['date']}: {r['hours']}h  (bed {r['bed_time']}, "
@@ -97,8 +90,13 @@ async def get_sleep_ai_insights(uid: str = Query(..., description="Firebase UID"
             "Do NOT wrap in markdown code blocks."
         )
 
-        groq_client = AsyncGroq(api_key=os.getenv("GROQ_API_KEY"))
-        response = await groq_client.chat.completions.create(
+        cache_key = hashlib.blake2b(user_prompt.encode(), digest_size=16).hexdigest()
+        if not refresh:
+            cached = _llm_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        response = await _groq_client.chat.completions.create(
             model="llama-3.3-70b-versatile",
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -118,12 +116,14 @@ async def get_sleep_ai_insights(uid: str = Query(..., description="Firebase UID"
         else:
             tips = []
 
-        return {
+        insights = {
             "ai_advice":      result.get("ai_advice", ""),
             "root_cause":     result.get("root_cause", ""),
             "trend_analysis": result.get("trend_analysis", ""),
             "tips":           tips,
         }
+        _llm_cache[cache_key] = insights
+        return insights
 
     except json.JSONDecodeError as e:
         raise HTTPException(
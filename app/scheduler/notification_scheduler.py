@@ -3,27 +3,41 @@
 
 import asyncio
 import logging
-from datetime import datetime, timedelta, timezone
-from functools import partial
-from typing import Optional
+from datetime import datetime, timedelta, timezone, tzinfo
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Any, Mapping, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
-import pytz
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
 from app.core.config import settings
+from app.db.locks import acquire_lease, release_lease
 from app.db.mongo import get_client
 from app.db.notification_state import (
-    get_all_pending_states,
-    upsert_state,
+    bulk_transition_states,
+    bulk_upsert_states,
+    get_due_states_with_tokens,
     update_scheduled_utc,
 )
-from app.services.fcm_service import send_data_message
+from app.services.fcm_service import send_batch_async
 from app.services.notification_templates import get_template, SNOOZE_MINUTES
 
 logger = logging.getLogger(__name__)
 
 DB_NAME = settings.MONGO_DB_NAME
 
+# Slots per bulk_write when seeding the whole user base (a batch may run
+# over by up to one user's schedule)
+SEED_BATCH_SIZE = 1000
+# Seed bulk_writes allowed in flight at once; bounds memory to a few batches
+SEED_MAX_IN_FLIGHT = 4
+
+# Cross-worker lease on the notification cycle; a crashed holder frees it
+# after CYCLE_LEASE rather than blocking cycles forever
+CYCLE_LOCK = "notification_cycle"
+CYCLE_LEASE = timedelta(minutes=10)
+
 
 # Default notification preferences
 
@@ -72,23 +86,43 @@ DEFAULT_PREFS = {
     "hydration_8_time":     "21:00",
 }
 
+# The prefs _schedule_for_prefs reads; only these go into its cache key, so
+# UI-only prefs (dark_mode, …) neither split the cache nor need be hashable
+_SCHEDULE_KEYS: tuple[str, ...] = tuple(
+    k for k in DEFAULT_PREFS
+    if k == "timezone" or k.endswith(("_enabled", "_time"))
+)
+
+# Schedule cache key for users without saved prefs
+_DEFAULT_PREFS_KEY = tuple(DEFAULT_PREFS[k] for k in _SCHEDULE_KEYS)
+
 
 # Helpers
 
+@lru_cache(maxsize=512)
+def _get_tz(tz_name: str) -> tzinfo:
+    """Zone for tz_name (UTC if unknown), looked up once per name."""
+    try:
+        return ZoneInfo(tz_name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return timezone.utc
+
+
+# Most users share a timezone and the default slot times, so seeding
+# resolves the same few (time, date, zone) triples over and over.
+@lru_cache(maxsize=4096)
 def _parse_local_time(time_str: str, date_str: str, tz_name: str) -> datetime:
     """
     Convert a "HH:MM" string + date "YYYY-MM-DD" in the given timezone
     to a UTC-aware datetime.
     """
-    try:
-        tz = pytz.timezone(tz_name)
-    except pytz.UnknownTimeZoneError:
-        tz = pytz.utc
-
-    local_dt = tz.localize(
-        datetime.strptime(f"{date_str} {time_str}", "%Y-%m-%d %H:%M")
+    # Fixed layouts: slice/split instead of running strptime
+    hh, _, mm = time_str.partition(":")
+    local_dt = datetime(
+        int(date_str[0:4]), int(date_str[5:7]), int(date_str[8:10]),
+        int(hh), int(mm), tzinfo=_get_tz(tz_name),
     )
-    return local_dt.astimezone(pytz.utc)
+    return local_dt.astimezone(timezone.utc)
 
 
 def _build_schedule(user_doc: dict, date_str: str, skip_past: bool = True) -> list[dict]:
@@ -109,20 +143,57 @@ def _build_schedule(user_doc: dict, date_str: str, skip_past: bool = True) -> li
     returned so that editing a past-due time still updates the stored
     scheduled_utc in MongoDB.
 
-    Returns list of {slot_label, notification_type, scheduled_utc}.
+    Returns list of {slot_label, notification_type, scheduled_utc, timezone}.
+    The timezone is stored on the state doc so quick-log can format the
+    user's local time without re-reading the user document.
     """
-    prefs = {**DEFAULT_PREFS, **(user_doc.get("notification_prefs") or {})}
-    
-    # Global Killswitch
-    if not prefs.get("global_enabled", True):
-        logger.info("Global notifications disabled for uid=%s", user_doc.get("firebase_uid"))
-        return []
+    custom = user_doc.get("notification_prefs")
+    if custom:
+        prefs = {**DEFAULT_PREFS, **custom}
+
+        # Global Killswitch
+        if not prefs.get("global_enabled", True):
+            logger.info("Global notifications disabled for uid=%s", user_doc.get("firebase_uid"))
+            return []
+        prefs_key = tuple(prefs[k] for k in _SCHEDULE_KEYS)
+    else:
+        # Never saved prefs: skip the merge and key build entirely
+        prefs_key = _DEFAULT_PREFS_KEY
+
+    # Users with identical prefs (most keep the defaults) share one schedule
+    try:
+        slots = _schedule_for_prefs(prefs_key, date_str)
+    except TypeError:
+        # An unhashable stored value (older docs) can't key the cache
+        slots = _schedule_for_prefs.__wrapped__(prefs_key, date_str)
+    if not skip_past:
+        return list(slots)
+    now_utc = datetime.now(timezone.utc)
+    return [slot for slot in slots if slot["scheduled_utc"] >= now_utc]
+
 
+@lru_cache(maxsize=256)
+def _schedule_for_prefs(
+    prefs_key: tuple, date_str: str,
+) -> tuple[Mapping[str, Any], ...]:
+    """
+    Every enabled slot for one merged prefs profile on date_str, past or
+    not. prefs_key holds the merged values of _SCHEDULE_KEYS, in order.
+    Slots are read-only because the cached tuple is shared.
+    """
+    prefs = dict(zip(_SCHEDULE_KEYS, prefs_key))
     tz_name = prefs.get("timezone", "Asia/Kolkata")
-    now_utc = datetime.now(timezone.utc)
 
     slots = []
 
+    def _add(slot_label: str, notif_type: str, t: str) -> None:
+        slots.append(MappingProxyType({
+            "slot_label":        slot_label,
+            "notification_type": notif_type,
+            "scheduled_utc":     _parse_local_time(t, date_str, tz_name),
+            "timezone":          tz_name,
+        }))
+
     # ── Sleep (2) ─────────────────────────────────────────────────────────
     if prefs.get("sleep_enabled", True):
         sleep_map = [
@@ -133,13 +204,7 @@ def _build_schedule(user_doc: dict, date_str: str, skip_past: bool = True) -> li
             if prefs.get(enabled_key, True):
                 t = prefs.get(time_key)
                 if t:
-                    utc = _parse_local_time(t, date_str, tz_name)
-                    if not skip_past or utc >= now_utc:
-                        slots.append({
-                            "slot_label":        notif_type,
-                            "notification_type": notif_type,
-                            "scheduled_utc":     utc,
-                        })
+                    _add(notif_type, notif_type, t)
 
     # ── Nutrition (6) ─────────────────────────────────────────────────────
     if prefs.get("nutrition_enabled", True):
@@ -155,13 +220,7 @@ def _build_schedule(user_doc: dict, date_str: str, skip_past: bool = True) -> li
             if prefs.get(enabled_key, True):
                 t = prefs.get(time_key)
                 if t:
-                    utc = _parse_local_time(t, date_str, tz_name)
-                    if not skip_past or utc >= now_utc:
-                        slots.append({
-                            "slot_label":        notif_type,
-                            "notification_type": notif_type,
-                            "scheduled_utc":     utc,
-                        })
+                    _add(notif_type, notif_type, t)
 
     # ── Hydration (8) ─────────────────────────────────────────────────────
     if prefs.get("hydration_enabled", True):
@@ -171,15 +230,9 @@ def _build_schedule(user_doc: dict, date_str: str, skip_past: bool = True) -> li
                 time_key = f"hydration_{idx}_time"
                 t = prefs.get(time_key)
                 if t:
-                    utc = _parse_local_time(t, date_str, tz_name)
-                    if not skip_past or utc >= now_utc:
-                        slots.append({
-                            "slot_label":        f"hydration_{idx}",
-                            "notification_type": "hydration",
-                            "scheduled_utc":     utc,
-                        })
+                    _add(f"hydration_{idx}", "hydration", t)
 
-    return slots
+    return tuple(slots)
 
 
 # Core Scheduler Jobs
@@ -187,7 +240,7 @@ def _build_schedule(user_doc: dict, date_str: str, skip_past: bool = True) -> li
 async def seed_daily_states(date_str: Optional[str] = None) -> int:
     """
     Insert `pending` notification_state docs for every enabled user.
-    Safe to call multiple times (upsert_state uses upsert=True with $setOnInsert).
+    Safe to call multiple times (upserts use upsert=True with $setOnInsert).
     Returns the number of slots seeded.
     """
     if date_str is None:
@@ -199,23 +252,45 @@ async def seed_daily_states(date_str: Optional[str] = None) -> int:
     users_cursor = db["users"].find(
         {"fcm_token": {"$exists": True, "$ne": None}},
         {"firebase_uid": 1, "notification_prefs": 1, "_id": 0},
-    )
-    users = await users_cursor.to_list(length=10000)
-
+    ).batch_size(500)
+
+    # Stream users and start an unordered bulk_write as soon as a batch of
+    # SEED_BATCH_SIZE slots fills, so writes go out while the rest is read.
+    # At most SEED_MAX_IN_FLIGHT batches are held; the oldest is awaited
+    # before another is started.
+    writes: list[asyncio.Task] = []
+    batch: list[dict] = []
     seeded = 0
-    for user in users:
-        uid  = user["firebase_uid"]
-        slots = _build_schedule(user, date_str)
-        for slot in slots:
-            await upsert_state(
-                firebase_uid=uid,
-                date=date_str,
-                slot_label=slot["slot_label"],
-                notification_type=slot["notification_type"],
-                scheduled_utc=slot["scheduled_utc"],
-                status="pending",
+    try:
+        async for user in users_cursor:
+            batch.extend(
+                {
+                    "firebase_uid":      user["firebase_uid"],
+                    "date":              date_str,
+                    "slot_label":        slot["slot_label"],
+                    "notification_type": slot["notification_type"],
+                    "scheduled_utc":     slot["scheduled_utc"],
+                    "timezone":          slot["timezone"],
+                    "status":            "pending",
+                }
+                for slot in _build_schedule(user, date_str)
             )
-            seeded += 1
+            if len(batch) >= SEED_BATCH_SIZE:
+                if len(writes) >= SEED_MAX_IN_FLIGHT:
+                    seeded += await writes.pop(0)
+                writes.append(asyncio.create_task(bulk_upsert_states(batch)))
+                batch = []
+                await asyncio.sleep(0)  # let the write go out before building on
+        if batch:
+            writes.append(asyncio.create_task(bulk_upsert_states(batch)))
+        seeded += sum(await asyncio.gather(*writes))
+    except BaseException:
+        # Never leave writes running unowned: cancel what is still in
+        # flight and wait it out so no error goes unretrieved
+        for task in writes:
+            task.cancel()
+        await asyncio.gather(*writes, return_exceptions=True)
+        raise
 
     logger.info("seed_daily_states: seeded %d slots for %s", seeded, date_str)
     return seeded
@@ -230,139 +305,127 @@ async def run_notification_cycle() -> dict:
       sent       + now >= sent_at + 15 min                   → send reminder → reminded_15
       reminded_15 + now >= reminded_15_at + 15 min           → send final   → reminded_30
       reminded_30 + now >= reminded_30_at + 15 min           → expire        → expired
+
+    Due messages are classified first, sent as one FCM batch, and the
+    resulting state transitions written back in one bulk_write.
+
+    Every worker process schedules this job; a MongoDB lease makes sure
+    only one of them runs a given cycle.
     """
+    lease = await acquire_lease(CYCLE_LOCK, CYCLE_LEASE)
+    if lease is None:
+        logger.info("Notification cycle already running in another worker; skipped.")
+        return {"sent": 0, "reminded_15": 0, "reminded_30": 0, "expired": 0, "skipped": 0}
+    try:
+        return await _run_cycle()
+    finally:
+        await release_lease(CYCLE_LOCK, lease)
+
+
+async def _run_cycle() -> dict:
     now = datetime.now(timezone.utc)
     date_str = now.strftime("%Y-%m-%d")
+    reminder_gap = timedelta(minutes=settings.REMINDER_15_MINUTES)
 
     client = get_client()
     db = client[DB_NAME]
 
-    states = await get_all_pending_states(date_str)
+    # Only the slots that are due now, with each owner's FCM token joined
+    # in server-side; the checks below just pick the transition.
+    states = await get_due_states_with_tokens(date_str, now, reminder_gap)
 
     stats = {"sent": 0, "reminded_15": 0, "reminded_30": 0, "expired": 0, "skipped": 0}
 
     if not states:
         return stats
 
-    # Batch-fetch FCM tokens for relevant users
-    uids = list({s["firebase_uid"] for s in states})
-    users_cursor = db["users"].find(
-        {"firebase_uid": {"$in": uids}},
-        {"firebase_uid": 1, "fcm_token": 1, "_id": 0},
-    )
-    token_map: dict[str, str] = {
-        u["firebase_uid"]: u.get("fcm_token", "")
-        for u in await users_cursor.to_list(length=len(uids))
-    }
-
-    # Track UIDs whose token was found invalid this cycle — skip them immediately
-    # and clear from DB once rather than hitting FCM on every slot.
-    stale_uids: set[str] = set()
-
-    async def _clear_token(uid: str) -> None:
-        """Remove the stale FCM token from MongoDB so we stop retrying."""
-        await db["users"].update_one(
-            {"firebase_uid": uid},
-            {"$unset": {"fcm_token": ""}},
-        )
-        logger.warning("Cleared stale FCM token for uid=%s", uid)
+    # (token, fcm data, state transition to apply if the send succeeds)
+    sends: list[tuple[str, dict, dict]] = []
+    # Transitions to write back (bulk_transition_states items)
+    transitions: list[dict] = []
 
     for state in states:
+        # Cheapest check first: tokenless users need nothing else read
+        token = state.get("fcm_token")
+        if not token:
+            stats["skipped"] += 1
+            continue
+
         uid        = state["firebase_uid"]
-        token      = token_map.get(uid, "")
         status     = state["status"]
         slot_label = state["slot_label"]
         notif_type = state["notification_type"]
-        scheduled  = state["scheduled_utc"]
-
-        # Make datetime timezone-aware if stored as naive UTC
-        if isinstance(scheduled, datetime) and scheduled.tzinfo is None:
-            scheduled = scheduled.replace(tzinfo=timezone.utc)
+        scheduled  = state["scheduled_utc"]   # state datetimes decode as aware UTC
 
-        if not token or uid in stale_uids:
-            stats["skipped"] += 1
-            continue
-
-        template = get_template(notif_type)
+        # (reminder_count, status update); reminder_count None = no send
+        step: Optional[tuple[Optional[int], dict]] = None
 
         if status == "pending" and now >= scheduled:
-            data = template.to_fcm_data(
-                uid=uid, slot_label=slot_label, date=date_str,
-                is_reminder=False, reminder_count=0,
-            )
-            result = await asyncio.get_event_loop().run_in_executor(
-                None, partial(send_data_message, token, data)
-            )
-            if result.success:
-                await upsert_state(
-                    firebase_uid=uid, date=date_str,
-                    slot_label=slot_label, notification_type=notif_type,
-                    scheduled_utc=scheduled,
-                    status="sent", sent_at=now,
-                )
-                stats["sent"] += 1
-            else:
-                logger.warning("FCM send failed for %s/%s: %s", uid, slot_label, result.error)
-                if result.error == "token_unregistered":
-                    stale_uids.add(uid)
-                    await _clear_token(uid)
+            step = 0, {"status": "sent", "sent_at": now}
 
         elif status == "sent":
             sent_at = state.get("sent_at")
-            if isinstance(sent_at, datetime) and sent_at.tzinfo is None:
-                sent_at = sent_at.replace(tzinfo=timezone.utc)
-            if sent_at and now >= sent_at + timedelta(minutes=settings.REMINDER_15_MINUTES):
-                data = template.to_fcm_data(
-                    uid=uid, slot_label=slot_label, date=date_str,
-                    is_reminder=True, reminder_count=1,
-                )
-                result = await asyncio.get_event_loop().run_in_executor(
-                    None, partial(send_data_message, token, data)
-                )
-                if result.success:
-                    await upsert_state(
-                        firebase_uid=uid, date=date_str,
-                        slot_label=slot_label, notification_type=notif_type,
-                        scheduled_utc=scheduled,
-                        status="reminded_15", reminded_15_at=now,
-                    )
-                    stats["reminded_15"] += 1
+            if sent_at and now >= sent_at + reminder_gap:
+                step = 1, {"status": "reminded_15", "reminded_15_at": now}
 
         elif status == "reminded_15":
             r15 = state.get("reminded_15_at")
-            if isinstance(r15, datetime) and r15.tzinfo is None:
-                r15 = r15.replace(tzinfo=timezone.utc)
-            if r15 and now >= r15 + timedelta(minutes=settings.REMINDER_15_MINUTES):
-                data = template.to_fcm_data(
-                    uid=uid, slot_label=slot_label, date=date_str,
-                    is_reminder=True, reminder_count=2,
-                )
-                result = await asyncio.get_event_loop().run_in_executor(
-                    None, partial(send_data_message, token, data)
-                )
-                if result.success:
-                    await upsert_state(
-                        firebase_uid=uid, date=date_str,
-                        slot_label=slot_label, notification_type=notif_type,
-                        scheduled_utc=scheduled,
-                        status="reminded_30", reminded_30_at=now,
-                    )
-                    stats["reminded_30"] += 1
+            if r15 and now >= r15 + reminder_gap:
+                step = 2, {"status": "reminded_30", "reminded_30_at": now}
 
         elif status == "reminded_30":
             r30 = state.get("reminded_30_at")
-            if isinstance(r30, datetime) and r30.tzinfo is None:
-                r30 = r30.replace(tzinfo=timezone.utc)
-            if r30 and now >= r30 + timedelta(minutes=settings.REMINDER_15_MINUTES):
+            if r30 and now >= r30 + reminder_gap:
                 # All types expire after the third reminder — user can
                 # always re-snooze via the need_15_min / need_30_min buttons.
-                await upsert_state(
-                    firebase_uid=uid, date=date_str,
-                    slot_label=slot_label, notification_type=notif_type,
-                    scheduled_utc=scheduled,
-                    status="expired",
-                )
-                stats["expired"] += 1
+                step = None, {"status": "expired"}
+
+        if step is None:
+            continue
+
+        reminder_count, fields = step
+        update = {
+            "firebase_uid":       uid,
+            "date":               date_str,
+            "slot_label":         slot_label,
+            "from_status":        status,
+            "from_scheduled_utc": scheduled,
+            **fields,
+        }
+        if reminder_count is None:
+            transitions.append(update)
+            stats["expired"] += 1
+            continue
+
+        data = get_template(notif_type).to_fcm_data(
+            uid=uid, slot_label=slot_label, date=date_str,
+            is_reminder=reminder_count > 0, reminder_count=reminder_count,
+        )
+        sends.append((token, data, update))
+
+    # Tokens FCM reported as invalid this cycle; cleared once, not per slot
+    stale_uids: set[str] = set()
+
+    results = await send_batch_async([(token, data) for token, data, _ in sends])
+    for (_, _, update), result in zip(sends, results):
+        if result.success:
+            transitions.append(update)
+            stats[update["status"]] += 1
+            continue
+        uid = update["firebase_uid"]
+        logger.warning("FCM send failed for %s/%s: %s", uid, update["slot_label"], result.error)
+        if result.error == "token_unregistered":
+            stale_uids.add(uid)
+
+    if stale_uids:
+        # Remove the stale FCM tokens so the next cycle skips these users
+        await db["users"].update_many(
+            {"firebase_uid": {"$in": list(stale_uids)}},
+            {"$unset": {"fcm_token": ""}},
+        )
+        logger.warning("Cleared stale FCM tokens for %d users", len(stale_uids))
+
+    await bulk_transition_states(transitions)
 
     logger.info("Notification cycle done: %s", stats)
     return stats
@@ -386,6 +449,9 @@ def create_scheduler() -> AsyncIOScheduler:
         name="Notification cycle",
         replace_existing=True,
         misfire_grace_time=60,
+        # A cycle still running when the next fires: skip, don't queue up
+        max_instances=1,
+        coalesce=True,
     )
 
     # Every day at 00:01 UTC: seed tomorrow's notification states
@@ -1,108 +1,162 @@
 # FCM service for sending data-only push notifications.
 
+import asyncio
 import logging
 from dataclasses import dataclass
 from typing import Optional
 
 import firebase_admin
-from firebase_admin import credentials, messaging
+from firebase_admin import credentials, exceptions, messaging
 from firebase_admin import _apps as firebase_apps
 
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# send_each / send_each_async accept at most this many messages per call
+FCM_BATCH_LIMIT = 500
+
+# Per-request HTTP timeout for FCM calls; firebase-admin's default is 120s
+FCM_HTTP_TIMEOUT = 10
+
 def _ensure_firebase_app() -> None:
     """Initialise firebase-admin once; safe to call multiple times."""
     if not firebase_apps:
         try:
             cred = credentials.Certificate(settings.FIREBASE_SERVICE_ACCOUNT_PATH)
-            firebase_admin.initialize_app(cred)
+            firebase_admin.initialize_app(cred, {"httpTimeout": FCM_HTTP_TIMEOUT})
             logger.info("Firebase Admin SDK initialised.")
         except Exception as exc:
             logger.error("Firebase Admin init failed: %s", exc)
             raise
 
+
+async def startup_fcm() -> None:
+    """
+    Initialise firebase-admin and fetch its OAuth access token up front,
+    so the first send does not pay for cert parsing and the token round trip.
+    """
+    _ensure_firebase_app()
+    # Blocking HTTP refresh; the messaging client shares this credential
+    await asyncio.to_thread(firebase_admin.get_app().credential.get_access_token)
+    logger.info("Firebase access token pre-fetched.")
+
 @dataclass
 class FCMResult:
     success: bool
     message_id: Optional[str] = None
     error: Optional[str] = None
 
-def send_data_message(
+# The encoder only reads AndroidConfig, so one instance per priority is
+# shared by every message instead of building one per send.
+_ANDROID_CONFIGS: dict[str, messaging.AndroidConfig] = {
+    priority: messaging.AndroidConfig(priority=priority, ttl=3600)  # 1 hour TTL
+    for priority in ("high", "normal")
+}
+
+
+def _build_message(
     fcm_token: str,
     data: dict[str, str],
-    *,
     android_priority: str = "high",
-) -> FCMResult:
-    """Send a data-only FCM message to a single device token."""
-    _ensure_firebase_app()
-
-    # FCM requires all data values to be strings
-    str_data = {k: str(v) for k, v in data.items()}
-
-    message = messaging.Message(
-        data=str_data,
+) -> messaging.Message:
+    # FCM requires all data values to be strings. Template payloads already
+    # are, so only copy when a caller slipped something else in.
+    if not all(type(v) is str for v in data.values()):
+        data = {k: str(v) for k, v in data.items()}
+    return messaging.Message(
+        data=data,
         token=fcm_token,
-        android=messaging.AndroidConfig(
-            priority=android_priority,
-            ttl=3600,  # 1 hour TTL
-        ),
+        android=_ANDROID_CONFIGS.get(android_priority)
+        or messaging.AndroidConfig(priority=android_priority, ttl=3600),
     )
 
-    try:
-        message_id = messaging.send(message)
-        logger.info("FCM sent OK: %s → %s", str_data.get("notification_type"), message_id)
-        return FCMResult(success=True, message_id=message_id)
-    except messaging.UnregisteredError:
+
+def _error_result(fcm_token: str, exc: Exception) -> FCMResult:
+    """Map a failed FCM send to an FCMResult the scheduler understands."""
+    # UnregisteredError is a NotFoundError; FCM answers 404 only for dead tokens
+    if isinstance(exc, exceptions.NotFoundError):
         logger.warning("FCM token unregistered: %s", fcm_token[:20])
         return FCMResult(success=False, error="token_unregistered")
-    except messaging.SenderIdMismatchError:
+    if isinstance(exc, messaging.SenderIdMismatchError):
         return FCMResult(success=False, error="sender_id_mismatch")
+    # "not a valid FCM registration token" is an InvalidArgumentError;
+    # treat it the same as an unregistered/expired token so the scheduler
+    # knows to clear it from the DB rather than retrying indefinitely.
+    if isinstance(exc, exceptions.InvalidArgumentError):
+        logger.warning("FCM token invalid (will be cleared): %s… — %s", fcm_token[:20], exc)
+        return FCMResult(success=False, error="token_unregistered")
+    logger.error("FCM send error: %s", exc)
+    return FCMResult(success=False, error=str(exc))
+
+
+async def send_data_message_async(
+    fcm_token: str,
+    data: dict[str, str],
+    *,
+    android_priority: str = "high",
+) -> FCMResult:
+    """
+    Send a data-only FCM message to a single device token.
+    Goes through firebase-admin's async transport, which keeps a pooled
+    HTTP/2 client to FCM instead of a blocking requests call.
+    """
+    _ensure_firebase_app()
+
+    message = _build_message(fcm_token, data, android_priority)
+
+    try:
+        batch_response = await messaging.send_each_async([message])
     except Exception as exc:
-        err_msg = str(exc)
-        # "not a valid FCM registration token" is an InvalidArgumentError;
-        # treat it the same as an unregistered/expired token so the scheduler
-        # knows to clear it from the DB rather than retrying indefinitely.
-        if "registration token" in err_msg.lower() or "invalid" in err_msg.lower():
-            logger.warning("FCM token invalid (will be cleared): %s… — %s", fcm_token[:20], err_msg)
-            return FCMResult(success=False, error="token_unregistered")
-        logger.error("FCM send error: %s", exc)
-        return FCMResult(success=False, error=err_msg)
-
-
-def send_batch(
+        return _error_result(fcm_token, exc)
+
+    resp = batch_response.responses[0]
+    if resp.success:
+        logger.info("FCM sent OK: %s → %s", message.data.get("notification_type"), resp.message_id)
+        return FCMResult(success=True, message_id=resp.message_id)
+    return _error_result(fcm_token, resp.exception)
+
+
+async def _send_chunk_async(
     token_data_pairs: list[tuple[str, dict[str, str]]],
 ) -> list[FCMResult]:
-    """Send data-only FCM messages to multiple tokens."""
-    _ensure_firebase_app()
+    messages = [_build_message(token, data) for token, data in token_data_pairs]
+    try:
+        batch_response = await messaging.send_each_async(messages)
+    except Exception as exc:
+        # Whole request failed (auth, transport); no token is known bad
+        logger.error("FCM batch error: %s", exc)
+        return [FCMResult(success=False, error=str(exc))] * len(messages)
 
+    logger.info(
+        "FCM batch: %d/%d sent successfully",
+        batch_response.success_count,
+        len(messages),
+    )
+    return [
+        FCMResult(success=True, message_id=resp.message_id)
+        if resp.success
+        else _error_result(token, resp.exception)
+        for (token, _), resp in zip(token_data_pairs, batch_response.responses)
+    ]
+
+
+async def send_batch_async(
+    token_data_pairs: list[tuple[str, dict[str, str]]],
+) -> list[FCMResult]:
+    """
+    Send data-only FCM messages to multiple tokens. Chunks of
+    FCM_BATCH_LIMIT go out concurrently over firebase-admin's async
+    transport. Results are returned in input order, with errors mapped
+    as for send_data_message_async (e.g. "token_unregistered").
+    """
     if not token_data_pairs:
         return []
+    _ensure_firebase_app()
 
-    messages = [
-        messaging.Message(
-            data={k: str(v) for k, v in data.items()},
-            token=token,
-            android=messaging.AndroidConfig(priority="high", ttl=3600),
-        )
-        for token, data in token_data_pairs
+    chunks = [
+        token_data_pairs[i:i + FCM_BATCH_LIMIT]
+        for i in range(0, len(token_data_pairs), FCM_BATCH_LIMIT)
     ]
-
-    try:
-        batch_response = messaging.send_each(messages)
-        results = []
-        for resp in batch_response.responses:
-            if resp.success:
-                results.append(FCMResult(success=True, message_id=resp.message_id))
-            else:
-                results.append(FCMResult(success=False, error=str(resp.exception)))
-        logger.info(
-            "FCM batch: %d/%d sent successfully",
-            batch_response.success_count,
-            len(messages),
-        )
-        return results
-    except Exception as exc:
-        logger.error("FCM batch error: %s", exc)
-        return [FCMResult(success=False, error=str(exc))] * len(token_data_pairs)
+    results = await asyncio.gather(*(_send_chunk_async(c) for c in chunks))
+    return [r for chunk in results for r in chunk]
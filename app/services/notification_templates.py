@@ -1,21 +1,19 @@
 # Notification templates and actions for the 16 slots.
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Optional
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class NotificationTemplate:
     notification_type: str
     title: str
     body: str
     emoji: str = ""
     # All templates use the same 3-action quick-log system
-    actions: list[str] = None  # type: ignore
-
-    def __post_init__(self):
-        if self.actions is None:
-            self.actions = ["yes", "need_15_min", "need_30_min"]
+    actions: tuple[str, ...] = ("yes", "need_15_min", "need_30_min")
+    # Static part of the FCM payload per (is_reminder, reminder_count)
+    _payloads: dict = field(default_factory=dict, init=False, repr=False, compare=False)
 
     def to_fcm_data(
         self,
@@ -30,19 +28,19 @@ class NotificationTemplate:
         Build the dict that goes into the FCM `data` payload.
         All values must be strings.
         """
-        prefix = "⏰ Reminder: " if is_reminder else ""
-        return {
-            "notification_type": self.notification_type,
-            "slot_label":        slot_label,
-            "date":              date,
-            "uid":               uid,
-            "title":             prefix + self.title,
-            "body":              self.body,
-            "actions":           ",".join(self.actions),  # Flutter splits on ","
-            "is_reminder":       str(is_reminder).lower(),
-            "reminder_count":    str(reminder_count),
-            "emoji":             self.emoji,
-        }
+        static = self._payloads.get((is_reminder, reminder_count))
+        if static is None:
+            prefix = "⏰ Reminder: " if is_reminder else ""
+            static = self._payloads[(is_reminder, reminder_count)] = {
+                "notification_type": self.notification_type,
+                "title":             prefix + self.title,
+                "body":              self.body,
+                "actions":           ",".join(self.actions),  # Flutter splits on ","
+                "is_reminder":       str(is_reminder).lower(),
+                "reminder_count":    str(reminder_count),
+                "emoji":             self.emoji,
+            }
+        return {**static, "slot_label": slot_label, "date": date, "uid": uid}
 
 
 # Registry
@@ -110,9 +108,13 @@ TEMPLATES: dict[str, NotificationTemplate] = {
 }
 
 
+# Fallback for unknown types, resolved once rather than on every lookup
+_DEFAULT_TEMPLATE: NotificationTemplate = TEMPLATES["hydration"]
+
+
 def get_template(notification_type: str) -> NotificationTemplate:
     """Return the template for notification_type, defaulting to hydration."""
-    return TEMPLATES.get(notification_type, TEMPLATES["hydration"])
+    return TEMPLATES.get(notification_type, _DEFAULT_TEMPLATE)
 
 
 # Action mappings
@@ -0,0 +1,13 @@
+# Per-uid cache of the /predictive/analysis payload, shared by the routes
+# that read it and the routes that write daily logs.
+from cachetools import TTLCache
+
+# The inputs only change when the user logs something, so writers evict
+# via invalidate_predictive_cache; the TTL bounds staleness from other
+# workers and profile edits.
+analysis_cache: TTLCache = TTLCache(maxsize=1024, ttl=300)
+
+
+def invalidate_predictive_cache(uid: str) -> None:
+    """Drop uid's cached /analysis payload after a daily_logs write."""
+    analysis_cache.pop(uid, None)
@@ -64,20 +64,37 @@ def compute_wellness(sleep_s: int, hydration_s: int, nutrition_s: int) -> int:
 
 # Main recompute helper
 
+# Fields recompute_scores reads; callers that already hold the day's
+# document fetch it with this projection and pass it in.
+SCORE_INPUT_PROJECTION = {
+    "_id": 0,
+    "sleep.hours": 1,
+    "hydration.total_ml": 1,
+    "nutrition.totals.calories": 1,
+    "scores": 1,
+}
+
+
 async def recompute_scores(
     db: AsyncIOMotorCollection,
     firebase_uid: str,
     date: str,
     *,
+    doc: dict | None = None,
     sleep_target_hours: float = 8.0,
     water_target_ml: int = 2500,
     calorie_target: int = 2000,
 ) -> dict:
     """
-    Fetch the day's document, recompute all scores, persist $set scores.*,
-    and return the updated scores dict.
+    Recompute all scores for the day, persist $set scores.* if they changed,
+    and return the scores dict.
+    Pass `doc` when the caller already has the day's document (at least
+    SCORE_INPUT_PROJECTION) to skip the read.
     """
-    doc = await db.find_one({"firebase_uid": firebase_uid, "date": date})
+    if doc is None:
+        doc = await db.find_one(
+            {"firebase_uid": firebase_uid, "date": date}, SCORE_INPUT_PROJECTION,
+        )
     if not doc:
         return {"sleep": 0, "hydration": 0, "nutrition": 0, "wellness": 0}
 
@@ -93,8 +110,9 @@ async def recompute_scores(
         "wellness":  w_score,
     }
 
-    await db.update_one(
-        {"firebase_uid": firebase_uid, "date": date},
-        {"$set": {"scores": scores, "updated_at": datetime.now(timezone.utc)}},
-    )
+    if doc.get("scores") != scores:
+        await db.update_one(
+            {"firebase_uid": firebase_uid, "date": date},
+            {"$set": {"scores": scores, "updated_at": datetime.now(timezone.utc)}},
+        )
     return scores